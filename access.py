@@ -0,0 +1,94 @@
+"""Shared access checks for dashboard routes.
+
+`load_user` and `website_memberships` answer from a short-TTL cache
+(see cache.py), and are memoized per request on `g`, so an authenticated
+page costs at most one query for the user and one for their memberships,
+and usually none.
+"""
+from functools import wraps
+from flask import current_app, g, flash, redirect, url_for, jsonify, abort
+from flask_login import current_user
+from sqlalchemy.orm import make_transient_to_detached
+from models import db, User, Website, WebsiteMember, GlobalRole
+from cache import Cache
+
+# Columns kept in the user cache; anything else (e.g. password_hash) lazy-loads
+USER_CACHE_COLUMNS = ('id', 'email', 'name', 'global_role', 'status', 'created_at', 'updated_at')
+
+access_cache = Cache('access', size_setting='ACCESS_CACHE_SIZE')
+
+
+def _ttl():
+    return current_app.config['ACCESS_CACHE_TTL']
+
+
+def load_user(user_id):
+    """Flask-Login user loader backed by the access cache."""
+    snapshot = access_cache.get(('user', user_id))
+    if snapshot is None:
+        user = db.session.get(User, user_id)
+        if not user:
+            return None
+        snapshot = {column: getattr(user, column) for column in USER_CACHE_COLUMNS}
+        access_cache.set(('user', user_id), snapshot, ttl=_ttl())
+        return user
+
+    # Rebuild a persistent User from the snapshot without hitting the DB
+    user = User(**snapshot)
+    make_transient_to_detached(user)
+    return db.session.merge(user, load=False)
+
+
+def website_memberships(user_id):
+    """{website_id: role} for a user, loaded at most once per request."""
+    memo = g.setdefault('_website_memberships', {})
+    if user_id in memo:
+        return memo[user_id]
+
+    memberships = access_cache.get(('members', user_id))
+    if memberships is None:
+        memberships = dict(db.session.query(
+            WebsiteMember.website_id, WebsiteMember.role
+        ).filter(WebsiteMember.user_id == user_id).all())
+        access_cache.set(('members', user_id), memberships, ttl=_ttl())
+    memo[user_id] = memberships
+    return memberships
+
+
+def invalidate_user_access(user_id):
+    """Drop cached user and membership data; call after changing either."""
+    access_cache.delete(('user', user_id))
+    access_cache.delete(('members', user_id))
+    g.pop('_website_memberships', None)
+
+
+def can_access_website(website_id):
+    if current_user.global_role == GlobalRole.SUPERADMIN:
+        return True
+    return website_id in website_memberships(current_user.id)
+
+
+def website_access_required(view=None, json=False):
+    """Resolve `website_id` to a Website the current user may access.
+
+    The view is called with `website=` instead of `website_id=`. Unknown
+    websites 404; non-members get redirected to the dashboard (or a 403
+    JSON error when `json` is set). Apply below @login_required.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapped(*args, website_id, **kwargs):
+            website = db.session.get(Website, website_id)
+            if website is None:
+                abort(404)
+            if not can_access_website(website.id):
+                if json:
+                    return jsonify({"error": "Unauthorized"}), 403
+                flash("Unauthorized")
+                return redirect(url_for('dashboard'))
+            return view(*args, website=website, **kwargs)
+        return wrapped
+
+    if view is not None:
+        return decorator(view)
+    return decorator
@@ -1,28 +1,53 @@
-from flask import Flask, render_template, redirect, url_for, flash, request, jsonify, make_response
-from flask_login import LoginManager, login_user, logout_user, login_required, current_user
+from flask import render_template, redirect, url_for, flash, request, jsonify, make_response, stream_with_context
+from flask_login import login_user, logout_user, login_required, current_user
 from werkzeug.security import generate_password_hash, check_password_hash
-from config import Config
-from models import db, User, Website, WebsiteMember, GlobalRole, UserStatus, Widget, WidgetType, WidgetStatus, WidgetPosition, Analytics, GlobalRole
-import uuid
+from models import db, User, Website, WebsiteMember, GlobalRole, Widget, WidgetType, WidgetStatus, WidgetPosition
 import json
-from flask_migrate import Migrate
-from flask_cors import CORS
-from datetime import datetime
+import csv
+import io
+from datetime import datetime, date, timedelta
 from sqlalchemy import func
-
-
-app = Flask(__name__)
-app.config.from_object(Config)
-
-db.init_app(app)
-migrate = Migrate(app, db)
-CORS(app, resources={r"/api/*": {"origins": "*"}})
-login_manager = LoginManager(app)
-login_manager.login_view = 'login'
-
-@login_manager.user_loader
-def load_user(user_id):
-    return User.query.get(user_id)
+from cache import Cache
+from factory import create_app
+from access import access_cache, website_memberships, invalidate_user_access, website_access_required
+from static_export import export_website
+from database import read_session
+from metrics import registry, cache_hit_ratio
+from public_api import config_cache
+from embed import embed_cache_key
+from tracking import MAX_CLIENT_SKEW
+from rollups import GRANULARITIES, SERIES_GRANULARITIES, rollup_query, series_query, unique_visitors, uniques_cache
+
+
+# Analytics time series responses, keyed by query parameters and the website's
+# series version (bumped when deleting a widget drops its rows from the totals).
+# Created before the app so the factory gives it the configured backend.
+series_cache = Cache('series', size_setting='SERIES_CACHE_SIZE')
+
+# Full dashboard app; the embed/tracking API comes from the factory (see public_api.py)
+app = create_app()
+login_manager = app.login_manager
+write_buffer = app.extensions['widgetic_ingest']
+
+registry.gauge('widgetic_series_cache_hit_ratio', 'Analytics series cache hit ratio.', cache_hit_ratio(series_cache))
+registry.gauge('widgetic_access_cache_hit_ratio', 'User/membership cache hit ratio.', cache_hit_ratio(access_cache))
+
+def bump_config_version(website):
+    # Call before committing any change that affects the public config
+    website.config_version = Website.config_version + 1
+
+def invalidate_website_config(public_key):
+    config_cache.delete(public_key)
+    config_cache.delete(embed_cache_key(public_key, app))
+
+    # On-write hook for the static export served straight by the web server
+    if app.config['STATIC_EXPORT_DIR']:
+        website = Website.query.filter_by(public_key=public_key).first()
+        if website:
+            try:
+                export_website(website, app.config['STATIC_EXPORT_DIR'])
+            except OSError:
+                app.logger.exception("Static export failed for %s", public_key)
 
 # Removed deprecated before_first_request
 
@@ -62,6 +87,7 @@ def register():
         member = WebsiteMember(user_id=user.id, website_id=company_site.id, role="ADMIN")
         db.session.add(member)
         db.session.commit()
+        invalidate_user_access(user.id)
 
         # Redirect to the new website
         return redirect(url_for('website_detail', website_id=company_site.id))
@@ -113,16 +139,21 @@ def index():
 def dashboard():
     # Superadmin sees all
     if current_user.global_role == GlobalRole.SUPERADMIN:
-        websites = Website.query.all()
-        return render_template('dashboard/websites.html', websites=websites)
+        session = read_session()
+        websites = session.query(Website).all()
+        # One grouped count instead of loading every website's widgets
+        widget_counts = dict(session.query(
+            Widget.website_id, func.count(Widget.id)
+        ).group_by(Widget.website_id).all())
+        return render_template('dashboard/websites.html', websites=websites, widget_counts=widget_counts)
     else:
         # Regular Users: Redirect to their first website
-        membership = WebsiteMember.query.filter_by(user_id=current_user.id).first()
-        if membership:
-            return redirect(url_for('website_detail', website_id=membership.website_id))
+        website_id = next(iter(website_memberships(current_user.id)), None)
+        if website_id:
+            return redirect(url_for('website_detail', website_id=website_id))
         else:
             # Fallback if no website exists (should be rare due to auto-create)
-            return render_template('dashboard/websites.html', websites=[])
+            return render_template('dashboard/websites.html', websites=[], widget_counts={})
 
 @app.route('/website/new', methods=['GET', 'POST'])
 @login_required
@@ -143,26 +174,44 @@ def create_new_website():
         member = WebsiteMember(user_id=current_user.id, website_id=website.id, role="ADMIN")
         db.session.add(member)
         db.session.commit()
+        invalidate_user_access(current_user.id)
         
         return redirect(url_for('dashboard'))
         
     return render_template('dashboard/create_website.html')
 
+def parse_date_arg(name):
+    """Parse an ISO date (YYYY-MM-DD) query arg, or None if missing or invalid."""
+    value = request.args.get(name)
+    try:
+        return date.fromisoformat(value) if value else None
+    except ValueError:
+        return None
+
+def website_totals(website_id):
+    """Lifetime counters and CTR for a website, summed in one SQL query."""
+    views, clicks, dismissals = read_session().query(
+        func.coalesce(func.sum(Widget.views), 0),
+        func.coalesce(func.sum(Widget.clicks), 0),
+        func.coalesce(func.sum(Widget.dismissals), 0)
+    ).filter(Widget.website_id == website_id).one()
+    return {
+        'views': views,
+        'clicks': clicks,
+        'dismissals': dismissals,
+        'ctr': (clicks / views * 100) if views > 0 else 0
+    }
+
 @app.route('/website/<website_id>')
 @login_required
-def website_detail(website_id):
-    website = Website.query.get_or_404(website_id)
-    # Check membership
-    member = WebsiteMember.query.filter_by(user_id=current_user.id, website_id=website.id).first()
-    if not member and current_user.global_role != GlobalRole.SUPERADMIN:
-        flash("Unauthorized")
-        return redirect(url_for('dashboard'))
+@website_access_required
+def website_detail(website):
         
     search_query = request.args.get('search', '')
     filter_type = request.args.get('type', '')
     filter_status = request.args.get('status', '')
 
-    query = Widget.query.filter_by(website_id=website.id)
+    query = read_session().query(Widget).filter_by(website_id=website.id)
 
     if search_query:
         query = query.filter(Widget.name.contains(search_query))
@@ -176,16 +225,14 @@ def website_detail(website_id):
     widgets = query.order_by(Widget.created_at.desc()).all()
     
     # Calculate stats
-    total_views = sum(w.views for w in website.widgets)
-    total_clicks = sum(w.clicks for w in website.widgets)
-    ctr = (total_clicks / total_views * 100) if total_views > 0 else 0
+    totals = website_totals(website.id)
     
     return render_template('dashboard/index.html', 
                            website=website, 
                            widgets=widgets, 
-                           total_views=total_views,
-                           total_clicks=total_clicks,
-                           ctr=ctr,
+                           total_views=totals['views'],
+                           total_clicks=totals['clicks'],
+                           ctr=totals['ctr'],
                            WidgetType=WidgetType, 
                            WidgetStatus=WidgetStatus,
                            search_query=search_query,
@@ -194,90 +241,262 @@ def website_detail(website_id):
 
 @app.route('/website/<website_id>/pricing')
 @login_required
-def website_pricing(website_id):
-    website = Website.query.get_or_404(website_id)
-    member = WebsiteMember.query.filter_by(user_id=current_user.id, website_id=website.id).first()
-    if not member and current_user.global_role != GlobalRole.SUPERADMIN:
-        flash("Unauthorized")
-        return redirect(url_for('dashboard'))
+@website_access_required
+def website_pricing(website):
         
     return render_template('dashboard/pricing.html', website=website)
 
 @app.route('/website/<website_id>/analytics')
 @login_required
-def website_analytics(website_id):
-    website = Website.query.get_or_404(website_id)
-    member = WebsiteMember.query.filter_by(user_id=current_user.id, website_id=website.id).first()
-    if not member and current_user.global_role != GlobalRole.SUPERADMIN:
-        flash("Unauthorized")
-        return redirect(url_for('dashboard'))
+@website_access_required
+def website_analytics(website):
 
     # Calculate stats
-    total_views = sum(w.views for w in website.widgets)
-    total_clicks = sum(w.clicks for w in website.widgets)
-    ctr = (total_clicks / total_views * 100) if total_views > 0 else 0
+    totals = website_totals(website.id)
+    
+    widget_choices = read_session().query(Widget.id, Widget.name).filter(
+        Widget.website_id == website.id
+    ).order_by(Widget.name).all()
     
     return render_template('dashboard/analytics.html', 
                             website=website, 
-                            widgets=website.widgets,
-                            total_views=total_views,
-                            total_clicks=total_clicks,
-                            ctr=ctr)
+                            widget_choices=widget_choices,
+                            total_views=totals['views'],
+                            total_clicks=totals['clicks'],
+                            total_dismissals=totals['dismissals'],
+                            ctr=totals['ctr'])
 
 @app.route('/website/<website_id>/analytics/table')
 @login_required
-def website_analytics_table(website_id):
-    website = Website.query.get_or_404(website_id)
-    member = WebsiteMember.query.filter_by(user_id=current_user.id, website_id=website.id).first()
-    if not member and current_user.global_role != GlobalRole.SUPERADMIN:
-        flash("Unauthorized")
-        return redirect(url_for('dashboard'))
-
-    # Fetch daily analytics for all widgets in this website
-    # Join with Widget to get the name, and aggregate duplicates
-    results = db.session.query(
-        Analytics.date, 
-        Widget, 
-        func.sum(Analytics.views).label('views'),
-        func.sum(Analytics.clicks).label('clicks'),
-        func.sum(Analytics.dismissals).label('dismissals')
-    ).join(Widget).filter(
-        Widget.website_id == website.id
-    ).group_by(
-        Analytics.date, Widget.id
-    ).order_by(
-        Analytics.date.desc()
-    ).all()
+@website_access_required
+def website_analytics_table(website):
+
+    # Filters: inclusive date range (defaults to the last 30 days) and optional widget
+    date_to = parse_date_arg('to') or datetime.utcnow().date()
+    date_from = parse_date_arg('from') or (date_to - timedelta(days=app.config['ANALYTICS_DEFAULT_RANGE_DAYS'] - 1))
+    filter_widget = request.args.get('widget', '')
+    page_size = max(1, min(request.args.get('limit', app.config['ANALYTICS_PAGE_SIZE'], type=int), 500))
+
+    # Keyset cursor: the (date, widget_id) of the last row on the previous page
+    after_date = parse_date_arg('after_date')
+    after_widget = request.args.get('after_widget', '')
+
+    rollup = rollup_query(
+        'day',
+        start=date_from,
+        end=min(date_to, after_date) if after_date else date_to,
+        website_id=website.id,
+        widget_ids=[filter_widget] if filter_widget else None
+    ).subquery()
+    session = read_session()
+    query = session.query(
+        rollup.c.bucket,
+        rollup.c.widget_id,
+        rollup.c.views,
+        rollup.c.clicks,
+        rollup.c.dismissals,
+        Widget.name,
+        Widget.type
+    ).join(Widget, Widget.id == rollup.c.widget_id)
+    if after_date:
+        query = query.filter(db.or_(
+            rollup.c.bucket < after_date,
+            db.and_(rollup.c.bucket == after_date, rollup.c.widget_id > after_widget)
+        ))
+    results = query.order_by(rollup.c.bucket.desc(), rollup.c.widget_id).limit(page_size + 1).all()
+
+    next_url = None
+    if len(results) > page_size:
+        results = results[:page_size]
+        next_url = url_for('website_analytics_table',
+                           website_id=website.id,
+                           to=date_to.isoformat(),
+                           widget=filter_widget or None,
+                           limit=page_size,
+                           after_date=results[-1].bucket.isoformat(),
+                           after_widget=results[-1].widget_id,
+                           **{'from': date_from.isoformat()})
     
-    # Structure for template: dict of {date: list of (stat_obj_like, widget)}
-    # We use a standard dictionary and sort keys in the template, or use a list of tuples
+    # Unique viewers for just the days on this page
+    uniques = {}
+    if results:
+        uniques = unique_visitors('day', start=results[-1].bucket, end=results[0].bucket, website_id=website.id,
+                                  widget_ids=[filter_widget] if filter_widget else None,
+                                  per_widget=True, session=session,
+                                  closed_before=datetime.utcnow() - MAX_CLIENT_SKEW)
+
+    # Structure for template: dict of {date: list of (stat, widget)}
     grouped_data = {}
     for r in results:
-        date_key = r[0]
         stat = {
-            'views': r[2] or 0,
-            'clicks': r[3] or 0,
-            'dismissals': r[4] or 0
+            'views': r.views or 0,
+            'uniques': uniques.get((r.bucket, r.widget_id)),
+            'clicks': r.clicks or 0,
+            'dismissals': r.dismissals or 0
         }
-        if date_key not in grouped_data:
-            grouped_data[date_key] = []
-        grouped_data[date_key].append((stat, r[1]))
+        widget = {'id': r.widget_id, 'name': r.name, 'type': r.type}
+        grouped_data.setdefault(r.bucket, []).append((stat, widget))
     
     # Sort dates descending
     sorted_dates = sorted(grouped_data.keys(), reverse=True)
+    widget_choices = session.query(Widget.id, Widget.name).filter(
+        Widget.website_id == website.id
+    ).order_by(Widget.name).all()
     
-    return render_template('dashboard/analytics_table.html', website=website, grouped_data=grouped_data, sorted_dates=sorted_dates)
+    return render_template('dashboard/analytics_table.html',
+                           website=website,
+                           grouped_data=grouped_data,
+                           sorted_dates=sorted_dates,
+                           date_from=date_from,
+                           date_to=date_to,
+                           filter_widget=filter_widget,
+                           widget_choices=widget_choices,
+                           next_url=next_url)
+
+
+
+@app.route('/website/<website_id>/analytics/export')
+@login_required
+@website_access_required(json=True)
+def website_analytics_export(website):
+
+    granularity = request.args.get('granularity', 'day')
+    export_format = request.args.get('format', 'csv')
+    if granularity not in GRANULARITIES or export_format not in ('csv', 'ndjson'):
+        return jsonify({"error": "Invalid granularity or format"}), 400
+
+    rollup = rollup_query(
+        granularity,
+        start=parse_date_arg('from'),
+        end=parse_date_arg('to'),
+        website_id=website.id
+    ).subquery()
+    stmt = db.select(
+        rollup.c.bucket,
+        rollup.c.widget_id,
+        Widget.name,
+        rollup.c.views,
+        rollup.c.clicks,
+        rollup.c.dismissals
+    ).join(Widget, Widget.id == rollup.c.widget_id).order_by(
+        rollup.c.bucket, rollup.c.widget_id
+    ).execution_options(yield_per=app.config['EXPORT_BATCH_SIZE'])
+
+    columns = ('bucket', 'widget_id', 'widget_name', 'views', 'clicks', 'dismissals')
+
+    def generate():
+        # Server-side cursor: rows arrive in batches, so memory stays flat
+        result = read_session().execute(stmt)
+        if export_format == 'csv':
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(columns)
+            for batch in result.partitions():
+                for row in batch:
+                    writer.writerow((row[0].isoformat(), *row[1:]))
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+            yield buffer.getvalue()
+        else:
+            for batch in result.partitions():
+                yield ''.join(
+                    json.dumps(dict(zip(columns, (row[0].isoformat(), *row[1:])))) + '\n'
+                    for row in batch
+                )
+
+    mimetype = 'text/csv' if export_format == 'csv' else 'application/x-ndjson'
+    response = app.response_class(stream_with_context(generate()), mimetype=mimetype)
+    response.headers['Content-Disposition'] = (
+        f'attachment; filename="analytics-{website.id}-{granularity}.{export_format}"'
+    )
+    return response
+
+
+def series_bucket(granularity, day):
+    # Start of the series bucket holding `day` (weeks start on Monday, like series_query)
+    if granularity == 'week':
+        return day - timedelta(days=day.weekday())
+    if granularity == 'month':
+        return day.replace(day=1)
+    return day
+
+
+def series_rows(website, granularity, start, end, widget_id, closed_before):
+    """(timestamp, views, clicks, dismissals, uniques) per bucket of [start, end]."""
+    session = read_session()
+    widget_ids = [widget_id] if widget_id else None
+    rows = session.execute(series_query(
+        granularity,
+        start=start,
+        end=end,
+        website_id=website.id,
+        widget_ids=widget_ids
+    )).all()
+    # Union of the buckets' visitor sketches; null where none were recorded
+    uniques = unique_visitors(granularity, start=start, end=end, website_id=website.id,
+                              widget_ids=widget_ids, session=session, closed_before=closed_before)
+    return [
+        (r.bucket.isoformat(), r.views or 0, r.clicks or 0, r.dismissals or 0, uniques.get(r.bucket))
+        for r in rows
+    ]
+
+
+@app.route('/api/website/<website_id>/analytics/series')
+@login_required
+@website_access_required(json=True)
+def website_analytics_series(website):
+
+    granularity = request.args.get('granularity', 'day')
+    if granularity not in SERIES_GRANULARITIES:
+        return jsonify({"error": "Invalid granularity"}), 400
+
+    date_to = parse_date_arg('to') or datetime.utcnow().date()
+    date_from = parse_date_arg('from') or (date_to - timedelta(days=app.config['ANALYTICS_DEFAULT_RANGE_DAYS'] - 1))
+    widget_id = request.args.get('widget') or None
+
+    # Late events may still land within MAX_CLIENT_SKEW; anything older is final.
+    # Buckets before the one holding that cutoff are cached without expiry and
+    # only the open tail (typically the current bucket) is recomputed.
+    closed_before = datetime.utcnow() - MAX_CLIENT_SKEW
+    closed = date_to < closed_before.date()
+    split = min(series_bucket(granularity, closed_before.date()), date_to + timedelta(days=1))
+    version = series_cache.version(website.id)
+    rows = []
+    for start, end, ttl in ((date_from, split - timedelta(days=1), None),
+                            (max(date_from, split), date_to, app.config['SERIES_CACHE_TTL'])):
+        if start > end:
+            continue
+        cache_key = (website.id, version, start, end, granularity, widget_id)
+        part = series_cache.get(cache_key)
+        if part is None:
+            part = series_rows(website, granularity, start, end, widget_id, closed_before)
+            series_cache.set(cache_key, part, ttl=ttl)
+        rows.extend(part)
+
+    # Column-oriented so the chart can use the arrays as-is
+    body = app.json.dumps({
+        "granularity": granularity,
+        "from": date_from.isoformat(),
+        "to": date_to.isoformat(),
+        "timestamps": [r[0] for r in rows],
+        "views": [r[1] for r in rows],
+        "clicks": [r[2] for r in rows],
+        "dismissals": [r[3] for r in rows],
+        "uniques": [r[4] for r in rows]
+    })
 
+    response = make_response(body)
+    response.mimetype = 'application/json'
+    max_age = 86400 if closed else app.config['SERIES_CACHE_TTL']
+    response.headers['Cache-Control'] = f"private, max-age={max_age}"
+    return response
 
 
 @app.route('/website/<website_id>/upgrade', methods=['POST'])
 @login_required
-def upgrade_website(website_id):
-    website = Website.query.get_or_404(website_id)
-    member = WebsiteMember.query.filter_by(user_id=current_user.id, website_id=website.id).first()
-    if not member and current_user.global_role != GlobalRole.SUPERADMIN:
-        flash("Unauthorized", "error")
-        return redirect(url_for('dashboard'))
+@website_access_required
+def upgrade_website(website):
         
     plan_price = request.form.get('price')
     
@@ -303,13 +522,8 @@ def upgrade_website(website_id):
 
 @app.route('/website/<website_id>/settings', methods=['POST'])
 @login_required
-def website_settings(website_id):
-    website = Website.query.get_or_404(website_id)
-    # Check membership
-    member = WebsiteMember.query.filter_by(user_id=current_user.id, website_id=website.id).first()
-    if not member and current_user.global_role != GlobalRole.SUPERADMIN:
-        flash("Unauthorized")
-        return redirect(url_for('dashboard'))
+@website_access_required
+def website_settings(website):
 
     # Update Settings
     hide_time = int(request.form.get('hide_time', 8))
@@ -337,7 +551,9 @@ def website_settings(website_id):
             "showBranding": show_branding
         }
     }
+    bump_config_version(website)
     db.session.commit()
+    invalidate_website_config(website.public_key)
     flash("Settings updated")
     return redirect(url_for('website_detail', website_id=website.id, tab='settings'))
 
@@ -345,12 +561,8 @@ def website_settings(website_id):
 
 @app.route('/website/<website_id>/widget/new', methods=['GET', 'POST'])
 @login_required
-def create_widget(website_id):
-    website = Website.query.get_or_404(website_id)
-    member = WebsiteMember.query.filter_by(user_id=current_user.id, website_id=website.id).first()
-    if not member and current_user.global_role != GlobalRole.SUPERADMIN:
-        flash("Unauthorized")
-        return redirect(url_for('dashboard'))
+@website_access_required
+def create_widget(website):
 
     # Check Limit
     current_count = Widget.query.filter_by(website_id=website.id).count()
@@ -387,7 +599,9 @@ def create_widget(website_id):
         )
         
         db.session.add(widget)
+        bump_config_version(website)
         db.session.commit()
+        invalidate_website_config(website.public_key)
         return redirect(url_for('website_detail', website_id=website.id))
         
     return render_template('dashboard/create_widget.html', website=website)
@@ -433,7 +647,9 @@ def edit_widget(widget_id):
                 print(f"DEBUG EDIT: Invalid type '{widget_type}'")
                 pass # Keep existing type if invalid
 
+        bump_config_version(widget.website)
         db.session.commit()
+        invalidate_website_config(widget.website.public_key)
         flash("Widget updated")
         return redirect(url_for('edit_widget', widget_id=widget.id, tab='settings'))
 
@@ -448,8 +664,13 @@ def delete_widget(widget_id):
         flash("Unauthorized")
         return redirect(url_for('dashboard'))
         
+    public_key = widget.website.public_key
+    bump_config_version(widget.website)
     db.session.delete(widget)
     db.session.commit()
+    invalidate_website_config(public_key)
+    series_cache.bump(website_id)
+    uniques_cache.bump(website_id)
     flash("Widget deleted")
     return redirect(url_for('website_detail', website_id=website_id))
 
@@ -466,83 +687,37 @@ def toggle_widget_status(widget_id):
     else:
         widget.status = WidgetStatus.ACTIVE
         
+    bump_config_version(widget.website)
     db.session.commit()
+    invalidate_website_config(widget.website.public_key)
     flash(f"Widget {widget.name} is now {widget.status.value}")
     return redirect(url_for('website_detail', website_id=widget.website_id, tab='toasts'))
 
 
-# API & Widget Routes
-
-@app.route('/api/website/<public_key>/config')
-def get_website_config(public_key):
-    website = Website.query.filter_by(public_key=public_key).first()
-    if not website:
-        return jsonify({"error": "Website not found"}), 404
-    
-    # Global Settings
-    settings = {
-        "timing": website.settings.get('timing', {"showTime": 5, "hideTime": 8}),
-        "position": website.settings.get('position', 'BOTTOM_RIGHT'),
-        "style": website.settings.get('style', {"backgroundColor": "#000000", "textColor": "#ffffff"}),
-        "behavior": website.settings.get('behavior', {"showCloseButton": False, "showBranding": False})
-    }
-
-    # Active Widgets
-    active_widgets = []
-    for widget in website.widgets:
-        if widget.status == WidgetStatus.ACTIVE:
-            active_widgets.append({
-                "id": widget.id,
-                "type": widget.type.name,
-                "content": widget.content,
-                "views": widget.views,
-                "clicks": widget.clicks
-            })
-
-    return jsonify({
-        "settings": settings,
-        "widgets": active_widgets
+@app.route('/website/<website_id>/stats')
+@login_required
+@website_access_required(json=True)
+def website_stats(website):
+
+    # Live counters, kept out of the cacheable public config
+    widgets = read_session().query(
+        Widget.id, Widget.views, Widget.clicks, Widget.dismissals
+    ).filter(Widget.website_id == website.id)
+
+    response = jsonify({
+        "widgets": [
+            {
+                "id": w.id,
+                "views": w.views or 0,
+                "clicks": w.clicks or 0,
+                "dismissals": w.dismissals or 0
+            }
+            for w in widgets
+        ]
     })
+    response.headers['Cache-Control'] = 'private, no-store'
+    return response
 
-# Analytics Tracking Endpoint
-@app.route('/api/widget/<widget_id>/track', methods=['POST'])
-def track_widget_event(widget_id):
-    data = request.json
-    event_type = data.get('type') # 'view' or 'click'
-    
-    widget = Widget.query.get(widget_id)
-    if not widget:
-        return jsonify({"error": "Widget not found"}), 404
-        
-    # 1. Update Total Stats
-    if event_type == 'view':
-        widget.views += 1
-    elif event_type == 'click':
-        widget.clicks += 1
-    elif event_type == 'dismiss':
-        widget.dismissals += 1
-        
-    # 2. Update Daily Stats (Analytics)
-    today = datetime.utcnow().date()
-    # Check if a record exists for today
-    daily_stat = Analytics.query.filter_by(widget_id=widget.id, date=today).first()
-    
-    if not daily_stat:
-        daily_stat = Analytics(widget_id=widget.id, date=today, views=0, clicks=0, dismissals=0)
-        db.session.add(daily_stat)
-    
-    if event_type == 'view':
-        daily_stat.views += 1
-    elif event_type == 'click':
-        daily_stat.clicks += 1
-    elif event_type == 'dismiss':
-        daily_stat.dismissals += 1
-        
-    db.session.commit()
-    return jsonify({"success": True})
-        
-    db.session.commit()
-    return jsonify({"success": True})
 
 if __name__ == '__main__':
     app.run(debug=True)
@@ -0,0 +1,412 @@
+"""Asyncio (ASGI) serving mode for the public embed and tracking API.
+
+    pip install uvicorn "sqlalchemy[asyncio]" aiosqlite   # or asyncpg for Postgres
+    uvicorn asgi:app --workers 2
+
+Serves the same routes, responses and headers as public_api.py (config,
+embed script, tracking, pixel, batch, CORS preflight) without a thread per
+connection: config misses are loaded through an async SQLAlchemy engine,
+and tracking only bumps an in-memory buffer that a background task applies
+with `apply_counts` every TRACKING_FLUSH_INTERVAL seconds, drained on
+shutdown. When TRACKING_EVENT_LOG or TRACKING_WRITE_BEHIND is enabled the
+events go to that ingest instead. Single events for unknown widgets get a
+404 as in synchronous Flask mode; whether a widget exists is cached for
+WIDGET_CACHE_TTL seconds, so one deleted meanwhile is still accepted (and
+dropped at flush) until its entry expires. Everything else 404s; run the dashboard
+(`app:app`) separately.
+
+The async database URL is derived from SQLALCHEMY_DATABASE_URI (sqlite ->
+sqlite+aiosqlite, postgresql -> postgresql+asyncpg) unless
+ASYNC_DATABASE_URL is set.
+"""
+from collections import Counter
+from urllib.parse import parse_qs
+import asyncio
+import io
+import json
+import logging
+import re
+from sqlalchemy import event
+from werkzeug.formparser import FormDataParser
+from werkzeug.http import parse_etags, parse_options_header, quote_etag
+from factory import create_app
+from cache import Cache
+from models import db, Website, Widget
+from database import pragma_listener
+from embed import build_website_config, encode_config, render_embed_script, content_etag, embed_cache_key
+from public_api import config_cache, TRACKING_PIXEL
+from tracking import (event_field, aggregate_events, aggregate_visitors, event_sketches, merge_sketch_maps,
+                      apply_counts, current_hour)
+
+logger = logging.getLogger('widgetic.asgi')
+
+ASYNC_DRIVERS = {
+    'sqlite': 'sqlite+aiosqlite',
+    'postgresql': 'postgresql+asyncpg'
+}
+
+# Larger request bodies are rejected with 413 before parsing
+MAX_BODY_BYTES = 1024 * 1024
+
+# What flask-cors answers preflights with for the default methods
+CORS_ALLOW_METHODS = 'DELETE, GET, HEAD, OPTIONS, PATCH, POST, PUT'
+
+CONFIG_PATH = re.compile(r'^/api/website/([^/]+)/config$')
+EMBED_PATH = re.compile(r'^/embed/([^/]+)\.js$')
+TRACK_PATH = re.compile(r'^/api/widget/([^/]+)/track$')
+PIXEL_PATH = re.compile(r'^/api/widget/([^/]+)/pixel\.gif$')
+BATCH_PATH = '/api/track/batch'
+
+# widget id -> whether it exists, for the single-event endpoints
+widget_cache = Cache('widgets', size_setting='WIDGET_CACHE_SIZE')
+WIDGET_CACHE_TTL = 60
+
+
+class AsyncWriteBehind:
+    """Asyncio counterpart of WriteBehindBuffer, flushed by a background task."""
+
+    def __init__(self, engine, interval=5.0, max_size=10000):
+        self.engine = engine
+        self.interval = interval
+        self.max_size = max_size
+        self._counts = Counter()
+        self._sketches = {}
+        self._wake = asyncio.Event()
+        self._task = None
+
+    def add(self, counts, sketches=None):
+        self._counts.update(counts)
+        if sketches:
+            merge_sketch_maps(self._sketches, sketches)
+        if len(self._counts) >= self.max_size:
+            self._wake.set()
+
+    def depth(self):
+        return len(self._counts)
+
+    async def flush(self):
+        counts, self._counts = self._counts, Counter()
+        sketches, self._sketches = self._sketches, {}
+        if not counts:
+            return 0
+        try:
+            async with self.engine.begin() as conn:
+                return await conn.run_sync(lambda sync_conn: apply_counts(counts, sync_conn, sketches))
+        except Exception:
+            # Put the deltas back so the next flush retries them
+            self._counts.update(counts)
+            merge_sketch_maps(self._sketches, sketches)
+            logger.exception("Async write-behind flush failed")
+            return 0
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            await self.flush()
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        await self.flush()
+
+
+def async_database_url(flask_app):
+    if flask_app.config.get('ASYNC_DATABASE_URL'):
+        return flask_app.config['ASYNC_DATABASE_URL']
+    with flask_app.app_context():
+        url = db.engine.url
+    driver = ASYNC_DRIVERS.get(url.get_backend_name())
+    if driver is None:
+        raise RuntimeError(f"No async driver known for {url.get_backend_name()}; set ASYNC_DATABASE_URL")
+    return url.set(drivername=driver)
+
+
+def _load_website_config(session, public_key):
+    # Runs on the async session's sync facade (see AsyncSession.run_sync)
+    website = session.scalars(db.select(Website).filter_by(public_key=public_key)).first()
+    return build_website_config(website, session) if website else None
+
+
+class PublicAPI:
+    """ASGI application; `flask_app` supplies config, JSON encoding and static files."""
+
+    def __init__(self, flask_app):
+        self.flask_app = flask_app
+        self.config = flask_app.config
+        self.engine = None
+        self.ingest = flask_app.extensions.get('widgetic_ingest')
+        self._own_ingest = None
+        self._startup_lock = asyncio.Lock()
+
+    # Lifespan
+
+    async def startup(self):
+        from sqlalchemy.ext.asyncio import create_async_engine
+
+        engine = create_async_engine(
+            async_database_url(self.flask_app),
+            **self.config.get('SQLALCHEMY_ENGINE_OPTIONS', {})
+        )
+        if engine.dialect.name == 'sqlite' and self.config['SQLITE_PRAGMAS']:
+            event.listen(engine.sync_engine, 'connect', pragma_listener(self.config['SQLITE_PRAGMAS']))
+
+        if self.ingest is None:
+            self._own_ingest = AsyncWriteBehind(
+                engine,
+                interval=self.config['TRACKING_FLUSH_INTERVAL'],
+                max_size=self.config['TRACKING_BUFFER_MAX']
+            )
+            self._own_ingest.start()
+            self.ingest = self._own_ingest
+        # Set last: requests that see an engine skip the startup lock
+        self.engine = engine
+
+    async def shutdown(self):
+        if self._own_ingest:
+            await self._own_ingest.stop()
+        if self.engine:
+            await self.engine.dispose()
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                try:
+                    await self.startup()
+                except Exception as e:
+                    logger.exception("ASGI startup failed")
+                    await send({'type': 'lifespan.startup.failed', 'message': str(e)})
+                    return
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.shutdown()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    # Helpers
+
+    def json_body(self, obj):
+        # Same bytes as Flask's jsonify outside debug mode
+        return (self.flask_app.json.dumps(obj, indent=None, separators=(',', ':')) + '\n').encode('utf-8')
+
+    async def get_cached_config(self, public_key):
+        """Return (body bytes, etag) for a website's public config, or None."""
+        cached = config_cache.get(public_key)
+        if cached is None:
+            from sqlalchemy.ext.asyncio import AsyncSession
+
+            async with AsyncSession(self.engine) as session:
+                config = await session.run_sync(_load_website_config, public_key)
+            if config is None:
+                return None
+            with self.flask_app.app_context():
+                body = encode_config(config)
+            cached = (body, content_etag(body))
+            config_cache.set(public_key, cached, ttl=self.config['CONFIG_CACHE_TTL'])
+        return cached
+
+    def conditional(self, request, status, body, headers, etag):
+        headers.append(('etag', quote_etag(etag)))
+        if status == 200 and parse_etags(request['headers'].get('if-none-match')).contains_weak(etag):
+            # 304 keeps the validators and caching headers but drops the entity
+            return 304, b'', [(name, value) for name, value in headers if name != 'content-type']
+        return status, body, headers
+
+    # Routes
+
+    async def website_config(self, request, public_key):
+        cached = await self.get_cached_config(public_key)
+        if cached is None:
+            return 404, self.json_body({"error": "Website not found"}), [('content-type', 'application/json')]
+        body, etag = cached
+        headers = [
+            ('content-type', 'application/json'),
+            ('cache-control', f"public, max-age={self.config['CONFIG_MAX_AGE']}")
+        ]
+        return self.conditional(request, 200, body, headers, etag)
+
+    async def embed_script(self, request, public_key):
+        cache_key = embed_cache_key(public_key, self.flask_app)
+        cached = config_cache.get(cache_key)
+        if cached is None:
+            config = await self.get_cached_config(public_key)
+            if config is None:
+                return (404, b'console.error("Widgetic: Website not found");\n',
+                        [('content-type', 'application/javascript; charset=utf-8')])
+            with self.flask_app.app_context():
+                script = render_embed_script(public_key, config[0])
+            cached = (script, content_etag(script))
+            config_cache.set(cache_key, cached, ttl=self.config['CONFIG_CACHE_TTL'])
+
+        script, etag = cached
+        headers = [
+            ('content-type', 'application/javascript; charset=utf-8'),
+            ('cache-control', f"public, max-age={self.config['EMBED_MAX_AGE']}, "
+                              f"stale-while-revalidate={self.config['EMBED_STALE_WHILE_REVALIDATE']}")
+        ]
+        return self.conditional(request, 200, script, headers, etag)
+
+    def track_single_event(self, widget_id, event_type, visitor=None):
+        # Always buffered here, like write-behind mode; callers have checked the widget exists
+        field = event_field(event_type)
+        if field:
+            hour = current_hour()
+            self.ingest.add({(widget_id, hour, field): 1}, event_sketches(widget_id, hour, field, visitor))
+
+    async def widget_exists(self, widget_id):
+        exists = widget_cache.get(widget_id)
+        if exists is None:
+            async with self.engine.connect() as conn:
+                exists = (await conn.execute(
+                    db.select(Widget.id).where(Widget.id == widget_id)
+                )).first() is not None
+            widget_cache.set(widget_id, exists, ttl=WIDGET_CACHE_TTL)
+        return exists
+
+    async def track_event(self, request, widget_id):
+        try:
+            data = json.loads(request['body'])
+        except ValueError:
+            data = None
+        if not isinstance(data, dict):
+            data = {}
+        if not await self.widget_exists(widget_id):
+            return 404, self.json_body({"error": "Widget not found"}), [('content-type', 'application/json')]
+        self.track_single_event(widget_id, data.get('type'), data.get('visitor'))
+        return 200, self.json_body({"success": True}), [('content-type', 'application/json')]
+
+    async def track_pixel(self, request, widget_id):
+        query = parse_qs(request['query'])
+        found = await self.widget_exists(widget_id)
+        if found:
+            self.track_single_event(widget_id, query.get('type', [None])[0], query.get('visitor', [None])[0])
+        return 200 if found else 404, TRACKING_PIXEL, [('content-type', 'image/gif'), ('cache-control', 'no-store')]
+
+    async def track_batch(self, request):
+        mimetype, options = parse_options_header(request['headers'].get('content-type', ''))
+        form_events = None
+        if mimetype in ('application/x-www-form-urlencoded', 'multipart/form-data'):
+            _, form, _ = FormDataParser().parse(io.BytesIO(request['body']), mimetype, len(request['body']), options)
+            form_events = form.get('events')
+
+        try:
+            data = json.loads(form_events if form_events else request['body'])
+        except ValueError:
+            data = None
+        events = data.get('events') if isinstance(data, dict) else data
+        if not isinstance(events, list):
+            return 400, self.json_body({"error": "Expected a list of events"}), [('content-type', 'application/json')]
+
+        max_events = self.config['TRACK_BATCH_MAX_EVENTS']
+        if len(events) > max_events:
+            return (413, self.json_body({"error": f"Batch exceeds {max_events} events"}),
+                    [('content-type', 'application/json')])
+
+        counts = aggregate_events(events)
+        self.ingest.add(counts, aggregate_visitors(events, data.get('visitor') if isinstance(data, dict) else None))
+        return (200, self.json_body({"success": True, "accepted": sum(counts.values())}),
+                [('content-type', 'application/json')])
+
+    def route(self, method, path):
+        """Return (handler, path args, allowed methods) for a request path."""
+        for pattern, handler, methods in (
+            (CONFIG_PATH, self.website_config, ('GET', 'HEAD')),
+            (EMBED_PATH, self.embed_script, ('GET', 'HEAD')),
+            (TRACK_PATH, self.track_event, ('POST',)),
+            (PIXEL_PATH, self.track_pixel, ('GET', 'HEAD')),
+        ):
+            match = pattern.match(path)
+            if match:
+                return handler, match.groups(), methods
+        if path == BATCH_PATH:
+            return self.track_batch, (), ('POST',)
+        return None, (), ()
+
+    # HTTP
+
+    async def read_body(self, receive):
+        chunks = []
+        size = 0
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return None
+            chunk = message.get('body', b'')
+            size += len(chunk)
+            if size > MAX_BODY_BYTES:
+                return False
+            chunks.append(chunk)
+            if not message.get('more_body'):
+                return b''.join(chunks)
+
+    async def http(self, scope, receive, send):
+        method = scope['method']
+        path = scope['path']
+        headers = {name.decode('latin-1'): value.decode('latin-1') for name, value in scope['headers']}
+        is_api = path.startswith('/api/')
+
+        handler, args, methods = self.route(method, path)
+        if is_api and method == 'OPTIONS' and handler and 'access-control-request-method' in headers:
+            status, body, response_headers = 200, b'', [
+                ('access-control-allow-methods', CORS_ALLOW_METHODS),
+                ('access-control-max-age', str(self.config['CORS_MAX_AGE']))
+            ]
+            if 'access-control-request-headers' in headers:
+                response_headers.append(('access-control-allow-headers', headers['access-control-request-headers']))
+        elif handler is None:
+            status, body, response_headers = 404, b'Not Found', [('content-type', 'text/plain; charset=utf-8')]
+        elif method not in methods and not (method == 'OPTIONS'):
+            status, body, response_headers = 405, b'Method Not Allowed', [
+                ('content-type', 'text/plain; charset=utf-8'), ('allow', ', '.join(methods + ('OPTIONS',)))
+            ]
+        elif method == 'OPTIONS':
+            status, body, response_headers = 200, b'', [('allow', ', '.join(methods + ('OPTIONS',)))]
+        else:
+            request_body = await self.read_body(receive) if method == 'POST' else b''
+            if request_body is None:
+                return
+            if request_body is False:
+                status, body, response_headers = 413, b'Request Entity Too Large', [('content-type', 'text/plain; charset=utf-8')]
+            else:
+                request = {'headers': headers, 'body': request_body, 'query': scope.get('query_string', b'').decode('latin-1')}
+                status, body, response_headers = await handler(request, *args)
+
+        if is_api and 'origin' in headers:
+            response_headers.append(('access-control-allow-origin', '*'))
+        response_headers.append(('content-length', str(len(body))))
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [(name.encode('latin-1'), value.encode('latin-1')) for name, value in response_headers]
+        })
+        await send({'type': 'http.response.body', 'body': b'' if method == 'HEAD' else body})
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+        elif scope['type'] == 'http':
+            if self.engine is None:
+                # Server without lifespan support: start lazily on the first request,
+                # once, however many requests arrive while the engine is being created
+                async with self._startup_lock:
+                    if self.engine is None:
+                        await self.startup()
+            await self.http(scope, receive, send)
+
+
+def create_asgi_app(config_name=None):
+    return PublicAPI(create_app(config_name, edge=True))
+
+
+app = create_asgi_app()
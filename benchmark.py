@@ -0,0 +1,356 @@
+"""Throughput/latency benchmark for the public API and dashboard pages.
+
+Builds a throwaway SQLite database of a given size, then drives the app
+either in-process (Flask test client) or over a local socket (werkzeug's
+threaded server), and reports req/s and p50/p95/p99 latency per scenario
+and concurrency level as JSON.
+
+    python benchmark.py --sizes small,medium --concurrency 1,8,32 > bench_output.txt
+    python benchmark.py --compare bench_output.txt   # exit 1 on regressions
+
+App settings are read from the environment as usual (e.g.
+TRACKING_WRITE_BEHIND=1), except DATABASE_URL, which always points at the
+temporary database.
+"""
+import argparse
+import http.client
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+# Datasets: websites, widgets per website, days of daily analytics per widget
+SIZES = {
+    'small': (5, 5, 30),
+    'medium': (50, 10, 90),
+    'large': (200, 20, 365)
+}
+
+SCENARIOS = ('config', 'track', 'dashboard', 'website_detail', 'analytics')
+
+
+def build_dataset(app, db, size):
+    """Recreate the schema and seed it. Returns the ids the scenarios need."""
+    from seed import seed_database
+    from models import User, Website, WebsiteMember, Widget, GlobalRole
+
+    n_websites, n_widgets, n_days = SIZES[size]
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        seed_database(websites=n_websites, widgets_per_website=n_widgets, days=n_days, seed=1)
+
+        # Regular users get redirected off /dashboard, so the website list is
+        # benchmarked as a superadmin and everything else as a member
+        admin_id = db.session.scalar(db.select(User.id).where(User.global_role == GlobalRole.SUPERADMIN))
+        user_id = db.session.scalar(
+            db.select(WebsiteMember.user_id).group_by(WebsiteMember.user_id)
+            .order_by(db.func.count().desc(), WebsiteMember.user_id).limit(1)
+        )
+        member_sites = set(db.session.scalars(
+            db.select(WebsiteMember.website_id).where(WebsiteMember.user_id == user_id)
+        ))
+        websites = db.session.execute(db.select(Website.id, Website.public_key).order_by(Website.id)).all()
+        widgets = list(db.session.scalars(db.select(Widget.id).order_by(Widget.id)))
+
+    return {
+        'user_id': user_id,
+        'admin_id': admin_id,
+        'websites': [tuple(row) for row in websites],
+        'member_websites': sorted(member_sites),
+        'widgets': widgets
+    }
+
+
+def scenario_requests(name, dataset):
+    """Endless iterator of (method, path, json_body) for a scenario."""
+    rng = random.Random(name)
+    websites = dataset['websites']
+    member_websites = dataset['member_websites']
+    widgets = dataset['widgets']
+    while True:
+        public_key = rng.choice(websites)[1]
+        website_id = rng.choice(member_websites)
+        if name == 'config':
+            yield 'GET', f'/api/website/{public_key}/config', None
+        elif name == 'track':
+            yield 'POST', f'/api/widget/{rng.choice(widgets)}/track', {
+                'type': rng.choice(('view', 'view', 'click')), 'visitor': f'bench-{rng.randrange(10000)}'
+            }
+        elif name == 'dashboard':
+            yield 'GET', '/dashboard', None
+        elif name == 'website_detail':
+            yield 'GET', f'/website/{website_id}', None
+        else:
+            yield 'GET', f'/website/{website_id}/analytics', None
+
+
+class InProcessClient:
+    def __init__(self, app, cookie):
+        self.client = app.test_client()
+        self.client.set_cookie(app.config['SESSION_COOKIE_NAME'], cookie)
+
+    def request(self, method, path, body):
+        response = self.client.open(path, method=method, json=body)
+        response.close()
+        return response.status_code
+
+    def close(self):
+        pass
+
+
+class SocketClient:
+    """Keep-alive HTTP/1.1 client for one worker thread."""
+
+    def __init__(self, host, port, cookie_header):
+        self.host = host
+        self.port = port
+        self.cookie_header = cookie_header
+        self.conn = None
+
+    def request(self, method, path, body):
+        if self.conn is None:
+            self.conn = http.client.HTTPConnection(self.host, self.port, timeout=30)
+        headers = {'Cookie': self.cookie_header}
+        payload = None
+        if body is not None:
+            payload = json.dumps(body)
+            headers['Content-Type'] = 'application/json'
+        try:
+            self.conn.request(method, path, body=payload, headers=headers)
+            response = self.conn.getresponse()
+            response.read()
+        except (OSError, http.client.HTTPException):
+            self.close()
+            raise
+        if response.will_close:
+            self.close()
+        return response.status
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+
+def start_server(app):
+    from werkzeug.serving import make_server, WSGIRequestHandler
+
+    class KeepAliveHandler(WSGIRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_request(self, *args, **kwargs):
+            pass
+
+    server = make_server('127.0.0.1', 0, app, threaded=True, request_handler=KeepAliveHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def percentile(sorted_values, pct):
+    # Nearest-rank percentile
+    if not sorted_values:
+        return None
+    index = max(0, min(len(sorted_values) - 1, int(round(pct / 100.0 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def run_scenario(make_client, requests_iter, total, concurrency, warmup):
+    lock = threading.Lock()
+    remaining = [total]
+    latencies = []
+    errors = [0]
+
+    def next_request():
+        with lock:
+            if remaining[0] <= 0:
+                return None
+            remaining[0] -= 1
+            return next(requests_iter)
+
+    def worker():
+        client = make_client()
+        local_latencies = []
+        local_errors = 0
+        try:
+            for _ in range(warmup):
+                with lock:
+                    req = next(requests_iter)
+                try:
+                    client.request(*req)
+                except (OSError, http.client.HTTPException):
+                    pass
+            barrier.wait()
+            while True:
+                req = next_request()
+                if req is None:
+                    break
+                start = time.perf_counter()
+                try:
+                    status = client.request(*req)
+                except (OSError, http.client.HTTPException):
+                    status = None
+                local_latencies.append(time.perf_counter() - start)
+                if status is None or status >= 300:  # redirects mean the session was rejected
+                    local_errors += 1
+        finally:
+            client.close()
+        with lock:
+            latencies.extend(local_latencies)
+            errors[0] += local_errors
+
+    barrier = threading.Barrier(concurrency + 1)
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    started = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    ms = lambda value: round(value * 1000, 3) if value is not None else None
+    return {
+        'requests': len(latencies),
+        'errors': errors[0],
+        'seconds': round(elapsed, 3),
+        'rps': round(len(latencies) / elapsed, 1) if elapsed else None,
+        'mean_ms': ms(sum(latencies) / len(latencies)) if latencies else None,
+        'p50_ms': ms(percentile(latencies, 50)),
+        'p95_ms': ms(percentile(latencies, 95)),
+        'p99_ms': ms(percentile(latencies, 99))
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=os.path.dirname(os.path.abspath(__file__)), stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(baseline_path, results, tolerance):
+    """Print scenarios slower than the baseline by more than `tolerance`; return how many."""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    key = lambda r: (r['size'], r['mode'], r['scenario'], r['concurrency'])
+    previous = {key(r): r for r in baseline['results']}
+    regressions = 0
+    for result in results:
+        before = previous.get(key(result))
+        if not before or not before['rps'] or not result['rps']:
+            continue
+        slower_rps = result['rps'] < before['rps'] * (1 - tolerance)
+        slower_p95 = result['p95_ms'] > before['p95_ms'] * (1 + tolerance)
+        if slower_rps or slower_p95:
+            regressions += 1
+            print(
+                "REGRESSION {} {} {} c={}: {} -> {} req/s, p95 {} -> {} ms".format(
+                    *key(result), before['rps'], result['rps'], before['p95_ms'], result['p95_ms']
+                ),
+                file=sys.stderr
+            )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default='small,medium', help=f"comma-separated, from {', '.join(SIZES)}")
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS))
+    parser.add_argument('--concurrency', default='1,8,32', help='comma-separated worker thread counts')
+    parser.add_argument('--mode', choices=('inprocess', 'socket', 'both'), default='both')
+    parser.add_argument('--requests', type=int, default=500, help='measured requests per run')
+    parser.add_argument('--warmup', type=int, default=5, help='unmeasured requests per worker')
+    parser.add_argument('--output', help='write JSON here instead of stdout')
+    parser.add_argument('--compare', metavar='BASELINE', help='baseline JSON; exit 1 if any run regressed')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed slowdown for --compare (0.2 = 20%%)')
+    args = parser.parse_args()
+
+    sizes = args.sizes.split(',')
+    scenarios = args.scenarios.split(',')
+    for name in sizes:
+        if name not in SIZES:
+            parser.error(f"unknown size {name!r}")
+    for name in scenarios:
+        if name not in SCENARIOS:
+            parser.error(f"unknown scenario {name!r}")
+    levels = [int(n) for n in args.concurrency.split(',')]
+    modes = ('inprocess', 'socket') if args.mode == 'both' else (args.mode,)
+
+    workdir = tempfile.mkdtemp(prefix='widgetic-bench-')
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(workdir, 'bench.db')
+    from app import app, db
+
+    results = []
+    server = start_server(app) if 'socket' in modes else None
+    try:
+        for size in sizes:
+            print(f"Building {size} dataset...", file=sys.stderr)
+            dataset = build_dataset(app, db, size)
+            serializer = app.session_interface.get_signing_serializer(app)
+            cookies = {
+                key: serializer.dumps({'_user_id': dataset[key], '_fresh': True})
+                for key in ('user_id', 'admin_id')
+            }
+            for mode in modes:
+                for scenario in scenarios:
+                    cookie = cookies['admin_id' if scenario == 'dashboard' else 'user_id']
+                    if mode == 'inprocess':
+                        make_client = lambda: InProcessClient(app, cookie)
+                    else:
+                        host, port = server.server_address[:2]
+                        cookie_header = f"{app.config['SESSION_COOKIE_NAME']}={cookie}"
+                        make_client = lambda: SocketClient(host, port, cookie_header)
+                    for concurrency in levels:
+                        stats = run_scenario(
+                            make_client, scenario_requests(scenario, dataset),
+                            args.requests, concurrency, args.warmup
+                        )
+                        result = {'size': size, 'mode': mode, 'scenario': scenario, 'concurrency': concurrency}
+                        result.update(stats)
+                        results.append(result)
+                        print(
+                            f"{size:<7} {mode:<9} {scenario:<15} c={concurrency:<3} "
+                            f"{stats['rps']} req/s  p50={stats['p50_ms']}ms p95={stats['p95_ms']}ms "
+                            f"p99={stats['p99_ms']}ms errors={stats['errors']}",
+                            file=sys.stderr
+                        )
+    finally:
+        if server:
+            server.shutdown()
+
+    report = {
+        'meta': {
+            'commit': git_commit(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'datasets': {size: dict(zip(('websites', 'widgets_per_website', 'days'), SIZES[size])) for size in sizes},
+            'requests_per_run': args.requests,
+            'write_behind': bool(app.config['TRACKING_WRITE_BEHIND'])
+        },
+        'results': results
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+    if args.compare and compare(args.compare, results, args.tolerance):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,253 @@
+"""Cache backends behind the config, access and analytics series caches.
+
+Each cache is a named `Cache` created at import time with the in-memory
+backend; `init_cache(app)` switches every one of them to the backend
+picked by CACHE_BACKEND:
+
+- ``memory``: `LRUCache`, per process. Invalidation (`delete`, `bump`)
+  only reaches the worker that made the change, so other workers rely on
+  TTLs.
+- ``sqlite``: `SQLiteCache`, one file (CACHE_PATH) shared by every worker
+  on the host, so an invalidation in one worker is seen by all of them.
+
+Both support `get`/`set`/`delete`/`clear` plus per-key version counters
+(`version`/`bump`) for invalidating a whole family of keys at once by
+folding the version into their keys. Hit/miss counts are per process and
+exported by metrics.py.
+"""
+from collections import OrderedDict
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+
+class LRUCache:
+    """Small thread-safe in-process LRU cache.
+
+    Used for hot read paths (e.g. the public website config) where entries
+    are explicitly invalidated on write. Entries set with a `ttl` (seconds)
+    also expire on their own.
+    """
+
+    def __init__(self, max_size=1024):
+        self.max_size = max_size
+        self._data = OrderedDict()
+        self._versions = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            try:
+                value, expires = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return None
+            if expires is not None and expires <= time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires = time.monotonic() + ttl if ttl is not None else None
+        with self._lock:
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def version(self, key):
+        return self._versions.get(key, 0)
+
+    def bump(self, key):
+        """Increment and return the version counter for `key`."""
+        with self._lock:
+            version = self._versions[key] = self._versions.get(key, 0) + 1
+            return version
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._versions.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class SQLiteCache:
+    """Cache stored in a SQLite file shared by every process on the host.
+
+    Entries of all caches live in one table, keyed by (namespace, repr of
+    the key), with pickled values, so keys must have a stable repr (str,
+    int, date, tuples of those) and the file must only be writable by the
+    app. Eviction is oldest-written first once a namespace exceeds
+    `max_size`, checked every PRUNE_EVERY writes.
+    """
+
+    PRUNE_EVERY = 256
+
+    def __init__(self, path, namespace, max_size=1024):
+        self.path = os.path.abspath(path)
+        self.namespace = namespace
+        self.max_size = max_size
+        self._local = threading.local()
+        self._writes = 0
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache_entry ("
+                "namespace TEXT NOT NULL, key TEXT NOT NULL, value BLOB NOT NULL, "
+                "expires REAL, written REAL NOT NULL, PRIMARY KEY (namespace, key)) WITHOUT ROWID"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache_version ("
+                "namespace TEXT NOT NULL, key TEXT NOT NULL, version INTEGER NOT NULL, "
+                "PRIMARY KEY (namespace, key)) WITHOUT ROWID"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_cache_entry_written ON cache_entry (namespace, written)")
+
+    def _connect(self):
+        # One connection per thread, never reused across a fork (e.g. gunicorn --preload)
+        pid, conn = getattr(self._local, 'conn', (None, None))
+        if pid != os.getpid():
+            # Autocommit; losing recent cache writes on a crash is fine
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode = WAL')
+            conn.execute('PRAGMA synchronous = OFF')
+            self._local.conn = (os.getpid(), conn)
+        return conn
+
+    def get(self, key):
+        row = self._connect().execute(
+            "SELECT value, expires FROM cache_entry WHERE namespace = ? AND key = ?",
+            (self.namespace, repr(key))
+        ).fetchone()
+        if row is None or (row[1] is not None and row[1] <= time.time()):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return pickle.loads(row[0])
+
+    def set(self, key, value, ttl=None):
+        now = time.time()
+        conn = self._connect()
+        conn.execute(
+            "INSERT OR REPLACE INTO cache_entry (namespace, key, value, expires, written) VALUES (?, ?, ?, ?, ?)",
+            (self.namespace, repr(key), pickle.dumps(value, pickle.HIGHEST_PROTOCOL),
+             now + ttl if ttl is not None else None, now)
+        )
+        self._writes += 1
+        if self._writes % self.PRUNE_EVERY == 0:
+            self.prune(conn)
+
+    def prune(self, conn=None):
+        """Drop expired entries, then the oldest ones beyond `max_size`."""
+        conn = conn or self._connect()
+        conn.execute("DELETE FROM cache_entry WHERE namespace = ? AND expires <= ?", (self.namespace, time.time()))
+        conn.execute(
+            "DELETE FROM cache_entry WHERE namespace = ? AND key IN ("
+            "SELECT key FROM cache_entry WHERE namespace = ? ORDER BY written DESC LIMIT -1 OFFSET ?)",
+            (self.namespace, self.namespace, self.max_size)
+        )
+
+    def delete(self, key):
+        self._connect().execute(
+            "DELETE FROM cache_entry WHERE namespace = ? AND key = ?", (self.namespace, repr(key))
+        )
+
+    def version(self, key):
+        row = self._connect().execute(
+            "SELECT version FROM cache_version WHERE namespace = ? AND key = ?", (self.namespace, repr(key))
+        ).fetchone()
+        return row[0] if row else 0
+
+    def bump(self, key):
+        """Increment and return the version counter for `key`, atomically across processes."""
+        return self._connect().execute(
+            "INSERT INTO cache_version (namespace, key, version) VALUES (?, ?, 1) "
+            "ON CONFLICT (namespace, key) DO UPDATE SET version = version + 1 RETURNING version",
+            (self.namespace, repr(key))
+        ).fetchone()[0]
+
+    def clear(self):
+        conn = self._connect()
+        conn.execute("DELETE FROM cache_entry WHERE namespace = ?", (self.namespace,))
+        conn.execute("DELETE FROM cache_version WHERE namespace = ?", (self.namespace,))
+
+    def __len__(self):
+        return self._connect().execute(
+            "SELECT count(*) FROM cache_entry WHERE namespace = ?", (self.namespace,)
+        ).fetchone()[0]
+
+
+# name -> Cache, for init_cache() and the metrics exporter
+caches = {}
+
+
+class Cache:
+    """Named cache delegating to the backend chosen by `init_cache`.
+
+    `size_setting` names the config key holding its maximum size.
+    """
+
+    def __init__(self, name, max_size=1024, size_setting=None):
+        self.name = name
+        self.size_setting = size_setting
+        self.backend = LRUCache(max_size)
+        caches[name] = self
+
+    @property
+    def hits(self):
+        return self.backend.hits
+
+    @property
+    def misses(self):
+        return self.backend.misses
+
+    def get(self, key):
+        return self.backend.get(key)
+
+    def set(self, key, value, ttl=None):
+        self.backend.set(key, value, ttl=ttl)
+
+    def delete(self, key):
+        self.backend.delete(key)
+
+    def version(self, key):
+        return self.backend.version(key)
+
+    def bump(self, key):
+        return self.backend.bump(key)
+
+    def clear(self):
+        self.backend.clear()
+
+    def __len__(self):
+        return len(self.backend)
+
+
+def init_cache(app):
+    """Give every named cache the backend and size configured for `app`."""
+    backend = app.config['CACHE_BACKEND']
+    if backend not in ('memory', 'sqlite'):
+        raise ValueError(f"Unknown CACHE_BACKEND {backend!r}")
+    path = app.config['CACHE_PATH'] or os.path.join(app.instance_path, 'cache.sqlite3')
+
+    for cache in caches.values():
+        max_size = app.config[cache.size_setting] if cache.size_setting else cache.backend.max_size
+        if backend == 'sqlite':
+            cache.backend = SQLiteCache(path, cache.name, max_size)
+        else:
+            cache.backend = LRUCache(max_size)
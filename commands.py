@@ -0,0 +1,61 @@
+from flask import current_app
+from flask.cli import AppGroup
+from static_export import export_static
+from rollups import compact
+from seed import seed_database
+from models import db
+import click
+
+widgetic_cli = AppGroup('widgetic', help='Widgetic maintenance commands.')
+
+
+@widgetic_cli.command('export-static')
+@click.option('--out', 'out_dir', default=None, help='Output directory (defaults to STATIC_EXPORT_DIR).')
+@click.option('--full', is_flag=True, help='Rewrite every website, not only changed ones.')
+def export_static_command(out_dir, full):
+    """Write public configs and embed scripts for static serving."""
+    out_dir = out_dir or current_app.config['STATIC_EXPORT_DIR']
+    if not out_dir:
+        raise click.UsageError("Pass --out or set STATIC_EXPORT_DIR.")
+
+    written, unchanged = export_static(out_dir, full=full)
+    click.echo(f"Exported {written} website(s), {unchanged} unchanged.")
+
+
+@widgetic_cli.command('compact')
+def compact_command():
+    """Fold old hourly analytics into daily rows and old daily rows into months."""
+    hourly, daily = compact(
+        current_app.config['ANALYTICS_HOURLY_RETENTION_HOURS'],
+        current_app.config['ANALYTICS_DAILY_RETENTION_DAYS']
+    )
+    click.echo(f"Compacted {hourly} hourly and {daily} daily row(s).")
+
+
+@widgetic_cli.command('seed')
+@click.option('--websites', default=1000, show_default=True, help='Number of websites to create.')
+@click.option('--widgets-per-website', default=10, show_default=True)
+@click.option('--days', default=365, show_default=True, help='Days of daily analytics history.')
+@click.option('--seed', default=42, show_default=True, help='Random seed; same seed, same data.')
+@click.option('--websites-per-user', default=5, show_default=True)
+@click.option('--chunk-size', default=50000, show_default=True, help='Analytics rows per executemany batch.')
+@click.option('--reset', is_flag=True, help='Drop and recreate all tables first (deletes ALL data).')
+def seed_command(websites, widgets_per_website, days, seed, websites_per_user, chunk_size, reset):
+    """Bulk-insert a large synthetic dataset for performance work."""
+    if reset:
+        click.confirm('This will delete ALL data. Continue?', abort=True)
+        db.drop_all()
+    db.create_all()
+
+    def progress(done, rows):
+        click.echo(f"  {done}/{websites} websites, {rows} analytics rows")
+
+    summary = seed_database(
+        websites=websites, widgets_per_website=widgets_per_website, days=days, seed=seed,
+        websites_per_user=websites_per_user, chunk_size=chunk_size, progress=progress
+    )
+    click.echo(
+        f"Seeded {summary['users']} user(s), {summary['websites']} website(s), "
+        f"{summary['widgets']} widget(s) and {summary['analytics_rows']} analytics row(s). "
+        f"Password for all seeded users: {summary['password']}"
+    )
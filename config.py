@@ -4,3 +4,124 @@ class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'dev-secret-key-change-in-production'
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or 'sqlite:///widget_app.db'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # Async driver URL for asgi.py; derived from the URL above when unset
+    ASYNC_DATABASE_URL = os.environ.get('ASYNC_DATABASE_URL') or None
+
+    # PRAGMA name -> value applied to every new SQLite connection (see database.py)
+    SQLITE_PRAGMAS = {}
+
+    # Seconds a user's row and website memberships stay cached for access checks
+    ACCESS_CACHE_TTL = int(os.environ.get('ACCESS_CACHE_TTL', 30))
+    ACCESS_CACHE_SIZE = int(os.environ.get('ACCESS_CACHE_SIZE', 4096))
+
+    # Per-request SQL query counts/timings (Server-Timing header) and slow-query log
+    SQL_INSTRUMENTATION = os.environ.get('SQL_INSTRUMENTATION', '').lower() in ('1', 'true', 'yes')
+    SLOW_QUERY_THRESHOLD_MS = float(os.environ.get('SLOW_QUERY_THRESHOLD_MS', 100))
+
+    # Prometheus metrics at /metrics; set METRICS_TOKEN to require "Authorization: Bearer <token>".
+    # Production only enables them with a token (see ProductionConfig).
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '1').lower() in ('1', 'true', 'yes')
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN') or None
+
+    # Tracking
+    TRACK_BATCH_MAX_EVENTS = int(os.environ.get('TRACK_BATCH_MAX_EVENTS', 500))
+
+    # Seconds browsers may cache CORS preflight results for /api/*
+    CORS_MAX_AGE = int(os.environ.get('CORS_MAX_AGE', 86400))
+
+    # Write-behind: buffer counters in-process and flush them in the background
+    TRACKING_WRITE_BEHIND = os.environ.get('TRACKING_WRITE_BEHIND', '').lower() in ('1', 'true', 'yes')
+    TRACKING_FLUSH_INTERVAL = float(os.environ.get('TRACKING_FLUSH_INTERVAL', 5))
+    TRACKING_BUFFER_MAX = int(os.environ.get('TRACKING_BUFFER_MAX', 10000))
+
+    # Durable alternative to write-behind: append events to a segmented log on
+    # disk and apply them in the background (see eventlog.py). Takes precedence
+    # over TRACKING_WRITE_BEHIND. EVENT_LOG_DIR defaults to instance/eventlog and
+    # holds one subdirectory per worker process.
+    TRACKING_EVENT_LOG = os.environ.get('TRACKING_EVENT_LOG', '').lower() in ('1', 'true', 'yes')
+    EVENT_LOG_DIR = os.environ.get('EVENT_LOG_DIR') or None
+    EVENT_LOG_SEGMENT_BYTES = int(os.environ.get('EVENT_LOG_SEGMENT_BYTES', 4 * 1024 * 1024))
+    EVENT_LOG_FSYNC_INTERVAL = float(os.environ.get('EVENT_LOG_FSYNC_INTERVAL', 0.05))
+    EVENT_LOG_COMPACT_INTERVAL = float(os.environ.get('EVENT_LOG_COMPACT_INTERVAL', 5))
+
+    # Backend for the config, access, series and uniques caches (see cache.py): "memory"
+    # per process, or "sqlite" shared by all workers on the host through
+    # CACHE_PATH (defaults to instance/cache.sqlite3)
+    CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'memory')
+    CACHE_PATH = os.environ.get('CACHE_PATH') or None
+
+    # Public config endpoint caching
+    CONFIG_CACHE_SIZE = int(os.environ.get('CONFIG_CACHE_SIZE', 1024))
+    # Seconds before a cached config is rebuilt. With the memory cache backend,
+    # dashboard writes only invalidate their own process (other workers, edge
+    # apps), so leaving this unset uses MEMORY_CONFIG_CACHE_TTL instead of
+    # caching forever. Unset with the sqlite backend means no expiry.
+    CONFIG_CACHE_TTL = int(os.environ['CONFIG_CACHE_TTL']) if os.environ.get('CONFIG_CACHE_TTL') else None
+    MEMORY_CONFIG_CACHE_TTL = int(os.environ.get('MEMORY_CONFIG_CACHE_TTL', 30))
+    CONFIG_MAX_AGE = int(os.environ.get('CONFIG_MAX_AGE', 60))
+    EMBED_MAX_AGE = int(os.environ.get('EMBED_MAX_AGE', 300))
+    EMBED_STALE_WHILE_REVALIDATE = int(os.environ.get('EMBED_STALE_WHILE_REVALIDATE', 86400))
+
+    # Static export of public configs/embeds (e.g. for nginx); empty disables the on-write hook
+    STATIC_EXPORT_DIR = os.environ.get('STATIC_EXPORT_DIR') or None
+
+    # Analytics rollups (see rollups.py). With write-behind or the event log,
+    # every worker compacts at most once per ANALYTICS_COMPACT_INTERVAL seconds
+    # (0 disables); otherwise run `flask widgetic compact` from cron, e.g. hourly.
+    ANALYTICS_HOURLY_RETENTION_HOURS = int(os.environ.get('ANALYTICS_HOURLY_RETENTION_HOURS', 48))
+    ANALYTICS_DAILY_RETENTION_DAYS = int(os.environ.get('ANALYTICS_DAILY_RETENTION_DAYS', 400))
+    ANALYTICS_COMPACT_INTERVAL = float(os.environ.get('ANALYTICS_COMPACT_INTERVAL', 3600))
+
+    # Analytics table page
+    ANALYTICS_PAGE_SIZE = int(os.environ.get('ANALYTICS_PAGE_SIZE', 50))
+    ANALYTICS_DEFAULT_RANGE_DAYS = int(os.environ.get('ANALYTICS_DEFAULT_RANGE_DAYS', 30))
+
+    # Rows fetched per batch by the streaming analytics export
+    EXPORT_BATCH_SIZE = int(os.environ.get('EXPORT_BATCH_SIZE', 1000))
+
+    # Analytics time series API; closed buckets are cached without expiry, the
+    # still-open tail of a range for SERIES_CACHE_TTL seconds
+    SERIES_CACHE_SIZE = int(os.environ.get('SERIES_CACHE_SIZE', 2048))
+    SERIES_CACHE_TTL = int(os.environ.get('SERIES_CACHE_TTL', 60))
+    # Unique visitor counts of closed buckets (see rollups.unique_visitors)
+    UNIQUES_CACHE_SIZE = int(os.environ.get('UNIQUES_CACHE_SIZE', 8192))
+
+    # Widget existence checks of the ASGI tracking endpoints (see asgi.py)
+    WIDGET_CACHE_SIZE = int(os.environ.get('WIDGET_CACHE_SIZE', 8192))
+
+
+class ProductionConfig(Config):
+    # WAL lets dashboard reads run alongside tracking writes, and NORMAL
+    # sync is durable enough there; busy_timeout waits out short write locks
+    # instead of failing with "database is locked"
+    SQLITE_PRAGMAS = {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'busy_timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000)),
+        'mmap_size': int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024)),
+        # Negative means KiB rather than pages
+        'cache_size': -int(os.environ.get('SQLITE_CACHE_SIZE_KB', 64 * 1024)),
+        'temp_store': 'MEMORY'
+    }
+
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        'pool_size': int(os.environ.get('DB_POOL_SIZE', 10)),
+        'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', 20)),
+        'pool_timeout': int(os.environ.get('DB_POOL_TIMEOUT', 10)),
+        'pool_recycle': 3600
+    }
+
+    # Request timings and cache/queue stats are not for the public internet
+    METRICS_ENABLED = Config.METRICS_ENABLED and Config.METRICS_TOKEN is not None
+
+    # Dashboard and export reads; point READONLY_DATABASE_URL at a replica to offload them
+    SQLALCHEMY_BINDS = {
+        'readonly': os.environ.get('READONLY_DATABASE_URL') or Config.SQLALCHEMY_DATABASE_URI
+    }
+
+
+# Selected with WIDGETIC_CONFIG
+configs = {
+    'default': Config,
+    'production': ProductionConfig
+}
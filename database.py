@@ -0,0 +1,54 @@
+"""Engine setup: SQLite pragmas and the read-only reporting engine.
+
+`init_database` applies SQLITE_PRAGMAS to every new connection of every
+engine. When a `readonly` bind is configured (see ProductionConfig),
+dashboard and export queries go through `read_session()`, whose
+connections are opened with `query_only` so they can never take the
+write lock; under WAL they read alongside tracking writes instead of
+waiting on them. Without that bind `read_session()` is just `db.session`.
+"""
+from flask import g
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from models import db
+
+READONLY_BIND = 'readonly'
+
+
+def pragma_listener(pragmas, query_only=False):
+    """`connect` event handler applying SQLite pragmas to a new DBAPI connection."""
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name} = {value}")
+        if query_only:
+            cursor.execute("PRAGMA query_only = ON")
+        cursor.close()
+    return set_pragmas
+
+
+def init_database(app):
+    pragmas = app.config['SQLITE_PRAGMAS']
+    with app.app_context():
+        engines = dict(db.engines)
+
+    for bind_key, engine in engines.items():
+        query_only = bind_key == READONLY_BIND
+        if engine.dialect.name == 'sqlite' and (pragmas or query_only):
+            event.listen(engine, 'connect', pragma_listener(pragmas, query_only))
+
+    @app.teardown_appcontext
+    def close_read_session(exc):
+        session = g.pop('_read_session', None)
+        if session is not None:
+            session.close()
+
+
+def read_session():
+    """Session for dashboard/export reads, closed at the end of the request."""
+    engine = db.engines.get(READONLY_BIND)
+    if engine is None:
+        return db.session
+    if '_read_session' not in g:
+        g._read_session = Session(engine)
+    return g._read_session
@@ -0,0 +1,11 @@
+"""Minimal WSGI entry point for embed and tracking traffic.
+
+Serves only the public API (config, embed script, tracking) plus /metrics,
+e.g. `gunicorn edge:app`. Route /api/* and /embed/* here and everything
+else to `app:app`. Config edits made through the dashboard reach these
+workers at once with CACHE_BACKEND=sqlite, and otherwise within
+CONFIG_CACHE_TTL (MEMORY_CONFIG_CACHE_TTL, 30 seconds, when unset).
+"""
+from factory import create_app
+
+app = create_app(edge=True)
@@ -0,0 +1,78 @@
+from flask import current_app
+from models import db, Widget, WidgetStatus
+import hashlib
+
+
+def build_website_config(website, session=None):
+    """Public, presentation-only config for a website's embed.
+
+    Queries through `session` (default `db.session`), which lets the ASGI
+    app run it on an async session via `run_sync`.
+    """
+    session = session or db.session
+    # Global Settings
+    settings = {
+        "timing": website.settings.get('timing', {"showTime": 5, "hideTime": 8}),
+        "position": website.settings.get('position', 'BOTTOM_RIGHT'),
+        "style": website.settings.get('style', {"backgroundColor": "#000000", "textColor": "#ffffff"}),
+        "behavior": website.settings.get('behavior', {"showCloseButton": False, "showBranding": False})
+    }
+
+    # Active Widgets
+    active_widgets = []
+    widgets = session.scalars(
+        db.select(Widget).filter_by(website_id=website.id, status=WidgetStatus.ACTIVE)
+        .order_by(Widget.created_at)
+    )
+    for widget in widgets:
+        active_widgets.append({
+            "id": widget.id,
+            "type": widget.type.name,
+            "content": widget.content
+        })
+
+    return {
+        "version": website.config_version,
+        "settings": settings,
+        "widgets": active_widgets
+    }
+
+
+def encode_config(config):
+    return current_app.json.dumps(config).encode('utf-8')
+
+
+def serialize_config(website):
+    return encode_config(build_website_config(website))
+
+
+def load_widget_runtime():
+    with current_app.open_resource('static/widget.js') as f:
+        return f.read()
+
+
+def render_embed_script(public_key, config_body, runtime=None):
+    """Prefix the widget runtime with an inlined config (see widget.js INLINE)."""
+    if runtime is None:
+        runtime = load_widget_runtime()
+    inline = b'{"key":' + current_app.json.dumps(public_key).encode('utf-8') + b',"config":' + config_body + b'}'
+    return b'window.__WIDGETIC_INLINE__ = ' + inline + b';\n' + runtime
+
+
+def content_etag(body):
+    return hashlib.sha256(body).hexdigest()[:32]
+
+
+def embed_cache_key(public_key, app=None):
+    """Cache key for a rendered embed script.
+
+    Includes a hash of widget.js, so a deploy with a new runtime never
+    serves scripts built from the old one out of a shared (SQLite) cache.
+    """
+    app = app or current_app
+    runtime_hash = app.extensions.get('widgetic_runtime_hash')
+    if runtime_hash is None:
+        with app.open_resource('static/widget.js') as f:
+            runtime_hash = content_etag(f.read())
+        app.extensions['widgetic_runtime_hash'] = runtime_hash
+    return f"embed:{runtime_hash}:{public_key}"
@@ -0,0 +1,435 @@
+"""Durable append-only event log for tracking ingestion.
+
+With TRACKING_EVENT_LOG enabled the tracking endpoints only append
+fixed-width binary records to the active segment file in EVENT_LOG_DIR
+and return, so ingestion never waits on a database lock. A background
+thread fsyncs the log every EVENT_LOG_FSYNC_INTERVAL seconds (one fsync
+covers every append since the last one), and the compactor seals the
+active segment every EVENT_LOG_COMPACT_INTERVAL seconds, aggregates the
+sealed segments and applies them with `apply_counts`.
+
+Visitor sketches travel as extra records (field code VISITOR_CODE) each
+carrying one HyperLogLog register update, which readers that predate
+them skip.
+
+Each segment is applied in the same transaction that advances its
+EventLogCheckpoint row, so a crash between that commit and deleting the
+file cannot count it twice: on restart, segments at or below the
+checkpoint are removed and the rest are replayed.
+
+Each process appends to its own WORKER_PREFIX<pid> subdirectory of
+EVENT_LOG_DIR, opened (and locked) on its first event, so gunicorn
+workers never share a directory and CLI commands or app instances that
+never track anything never touch the log. The compactor also drains
+subdirectories whose lock is free, i.e. left by workers that exited.
+"""
+from collections import Counter
+from datetime import datetime, timedelta
+import atexit
+import logging
+import os
+import struct
+import threading
+import time
+import uuid
+from sqlalchemy.exc import SQLAlchemyError
+from models import db, EventLogCheckpoint
+from rollups import COUNTER_FIELDS, compact_if_due
+from tracking import apply_counts
+from hll import HyperLogLog, PRECISION
+
+try:
+    import fcntl
+except ImportError:  # Windows: no advisory lock, rely on configuration
+    fcntl = None
+
+logger = logging.getLogger('widgetic.eventlog')
+
+MAGIC = b'WGEV'
+VERSION = 1
+# magic, format version, record size, segment sequence number
+HEADER = struct.Struct('<4sHHQ')
+# widget id (UUID bytes), hours since the epoch, counter field index, count
+RECORD = struct.Struct('<16sIBH')
+MAX_RECORD_COUNT = 2 ** 16 - 1
+
+# Field code of visitor records; their count packs (register index << 6 | rank)
+VISITOR_CODE = 255
+RANK_BITS = 6
+assert PRECISION + RANK_BITS <= 16, "register updates must fit a record count"
+
+EPOCH = datetime(1970, 1, 1)
+SEGMENT_SUFFIX = '.seg'
+WORKER_PREFIX = 'worker-'
+
+
+def _widget_bytes(widget_id):
+    try:
+        return uuid.UUID(widget_id).bytes
+    except (ValueError, AttributeError, TypeError):
+        return None  # Widget ids are UUIDs, so this widget cannot exist
+
+
+def _hours(hour):
+    return int((hour - EPOCH).total_seconds()) // 3600
+
+
+def encode_counts(counts, sketches=None):
+    """Pack {(widget_id, hour, field): n} and visitor sketches into records.
+
+    Skips non-UUID widget ids. Returns (bytes, number of events packed).
+    """
+    chunks = []
+    events = 0
+    for (widget_id, hour, field), n in counts.items():
+        widget = _widget_bytes(widget_id)
+        if widget is None:
+            continue
+        hours = _hours(hour)
+        code = COUNTER_FIELDS.index(field)
+        events += n
+        while n > 0:
+            chunks.append(RECORD.pack(widget, hours, code, min(n, MAX_RECORD_COUNT)))
+            n -= MAX_RECORD_COUNT
+    for (widget_id, hour), sketch in (sketches or {}).items():
+        widget = _widget_bytes(widget_id)
+        if widget is None:
+            continue
+        hours = _hours(hour)
+        for index, rank in sketch.nonzero():
+            chunks.append(RECORD.pack(widget, hours, VISITOR_CODE, index << RANK_BITS | rank))
+    return b''.join(chunks), events
+
+
+def decode_records(data):
+    """Aggregate packed records back into (Counter of (widget_id, hour, field), sketches)."""
+    counts = Counter()
+    sketches = {}
+    usable = len(data) - len(data) % RECORD.size  # Drop a torn trailing record
+    for widget, hours, code, n in RECORD.iter_unpack(data[:usable]):
+        if code == VISITOR_CODE:
+            key = (str(uuid.UUID(bytes=widget)), EPOCH + timedelta(hours=hours))
+            sketch = sketches.get(key)
+            if sketch is None:
+                sketch = sketches[key] = HyperLogLog()
+            sketch.set_register(n >> RANK_BITS, n & ((1 << RANK_BITS) - 1))
+            continue
+        if code >= len(COUNTER_FIELDS):
+            continue
+        counts[(str(uuid.UUID(bytes=widget)), EPOCH + timedelta(hours=hours), COUNTER_FIELDS[code])] += n
+    return counts, sketches
+
+
+def read_segment(path):
+    """Return (sequence number, counts, sketches) for a segment file.
+
+    Raises ValueError if the header is missing or from another format version.
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    if len(data) < HEADER.size:
+        raise ValueError(f"{path}: truncated header")
+    magic, version, record_size, seq = HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION or record_size != RECORD.size:
+        raise ValueError(f"{path}: unsupported segment (version {version})")
+    return (seq,) + decode_records(data[HEADER.size:])
+
+
+class EventLog:
+    """Segmented append-only log with the same `add`/`depth` interface as WriteBehindBuffer.
+
+    `base_directory` holds one subdirectory per process; this process's is
+    opened by the first `add` (or an explicit `open`).
+    """
+
+    def __init__(self, app, base_directory, segment_bytes=4 * 1024 * 1024,
+                 fsync_interval=0.05, compact_interval=5.0):
+        self.app = app
+        self.base_directory = os.path.abspath(base_directory)
+        self.segment_bytes = segment_bytes
+        self.fsync_interval = fsync_interval
+        self.compact_interval = compact_interval
+        self.directory = None
+        self._pid = None
+        self._open_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._compact_lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._threads = []
+        self._lock_file = None
+        self._fd = None
+        self._seq = 0
+        self._size = 0
+        self._dirty = False
+        self._pending = 0
+
+    def _is_open(self):
+        # False in a forked child until it opens its own directory
+        return self._pid == os.getpid()
+
+    # Segment files
+
+    def _path(self, seq, directory=None):
+        return os.path.join(directory or self.directory, f'{seq:016d}{SEGMENT_SUFFIX}')
+
+    def _segment_seqs(self, directory=None):
+        return sorted(
+            int(name[:-len(SEGMENT_SUFFIX)]) for name in os.listdir(directory or self.directory)
+            if name.endswith(SEGMENT_SUFFIX) and name[:-len(SEGMENT_SUFFIX)].isdigit()
+        )
+
+    def _checkpoint(self, directory=None):
+        with self.app.app_context():
+            try:
+                checkpoint = db.session.get(EventLogCheckpoint, directory or self.directory)
+                return checkpoint.segment if checkpoint else 0
+            finally:
+                db.session.remove()
+
+    def _open_segment(self, seq):
+        fd = os.open(self._path(seq), os.O_WRONLY | os.O_CREAT | os.O_EXCL | os.O_APPEND, 0o644)
+        os.write(fd, HEADER.pack(MAGIC, VERSION, RECORD.size, seq))
+        self._fd = fd
+        self._seq = seq
+        self._size = HEADER.size
+        self._dirty = True
+
+    def _roll(self):
+        # Caller holds self._lock. Seals the active segment if it has records.
+        if self._size == HEADER.size:
+            return
+        os.fsync(self._fd)
+        os.close(self._fd)
+        self._open_segment(self._seq + 1)
+
+    @staticmethod
+    def _try_lock(directory):
+        """Open and exclusively lock `directory`/LOCK; returns the file, or None if held elsewhere."""
+        lock_file = open(os.path.join(directory, 'LOCK'), 'a')
+        if fcntl:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                lock_file.close()
+                return None
+        return lock_file
+
+    def open(self):
+        """Take ownership of this process's directory and start a fresh active segment.
+
+        Segments left by a previous process with the same pid are all
+        treated as sealed; they are replayed by the next compaction.
+        """
+        directory = os.path.join(self.base_directory, f'{WORKER_PREFIX}{os.getpid()}')
+        os.makedirs(directory, exist_ok=True)
+        lock_file = self._try_lock(directory)
+        if lock_file is None:
+            raise RuntimeError(f"Event log {directory} is in use by another process")
+
+        # State inherited across a fork belongs to the parent's directory
+        self.directory = directory
+        self._lock_file = lock_file
+        self._fd = None
+        self._pending = 0
+        self._threads = []
+        self._stopped = threading.Event()
+
+        existing = self._segment_seqs()
+        for seq in existing:
+            try:
+                self._pending += sum(read_segment(self._path(seq))[1].values())
+            except ValueError:
+                pass
+        try:
+            checkpoint = self._checkpoint()
+        except SQLAlchemyError:
+            checkpoint = 0  # Not migrated yet; nothing can have been applied
+        # New segments must sort above everything applied or on disk, or
+        # compact() would drop them as already applied. The clock (ms) keeps
+        # that true when the checkpoint is unreadable and the files are gone;
+        # it is only a floor, so a clock stepping back cannot reuse a number.
+        self._open_segment(max(existing + [checkpoint, int(time.time() * 1000)]) + 1)
+        self._pid = os.getpid()
+
+    def _ensure_open(self):
+        with self._open_lock:
+            if not self._is_open():
+                self.open()
+                self.start()
+
+    # Ingestion
+
+    def add(self, counts, sketches=None):
+        data, events = encode_counts(counts, sketches)
+        if not data:
+            return
+        if not self._is_open():
+            self._ensure_open()
+        with self._lock:
+            if self._fd is None:
+                self._open_segment(self._seq + 1)
+            os.write(self._fd, data)
+            self._size += len(data)
+            self._dirty = True
+            self._pending += events
+            if self._size >= self.segment_bytes:
+                self._roll()
+
+    def depth(self):
+        """Events appended by this process but not yet applied to the database."""
+        return self._pending if self._is_open() else 0
+
+    def sync(self):
+        with self._lock:
+            if not self._dirty or self._fd is None:
+                return
+            self._dirty = False
+            fd = self._fd
+        try:
+            os.fsync(fd)
+        except OSError:
+            pass  # Rolled (and fsynced) while we were waiting
+
+    # Compaction
+
+    def _apply_sealed(self, directory, below=None):
+        """Apply the segments of `directory` in order, stopping at sequence `below`.
+
+        Returns (events applied, whether every segment was handled).
+        """
+        checkpoint = self._checkpoint(directory)
+        applied = 0
+        for seq in self._segment_seqs(directory):
+            if below is not None and seq >= below:
+                break
+            path = self._path(seq, directory)
+            if seq <= checkpoint:
+                os.remove(path)  # Applied before a crash, not yet deleted
+                continue
+            try:
+                _, counts, sketches = read_segment(path)
+            except ValueError:
+                logger.exception("Skipping unreadable event log segment")
+                continue
+
+            with self.app.app_context():
+                try:
+                    applied += apply_counts(counts, sketches=sketches)
+                    db.session.merge(EventLogCheckpoint(log=directory, segment=seq))
+                    db.session.commit()
+                except Exception:
+                    db.session.rollback()
+                    logger.exception("Applying event log segment %s failed", seq)
+                    return applied, False  # Retried in order on the next run
+                finally:
+                    db.session.remove()
+            os.remove(path)
+            if directory == self.directory:
+                self._pending = max(0, self._pending - sum(counts.values()))
+        return applied, True
+
+    def _drain_orphans(self):
+        """Apply and remove the directories of processes that no longer hold their lock."""
+        if fcntl is None:
+            return 0  # No way to tell a live worker from a dead one
+        applied = 0
+        for name in sorted(os.listdir(self.base_directory)):
+            directory = os.path.join(self.base_directory, name)
+            if not name.startswith(WORKER_PREFIX) or directory == self.directory or not os.path.isdir(directory):
+                continue
+            lock_file = self._try_lock(directory)
+            if lock_file is None:
+                continue  # Its worker is still running
+            try:
+                done, complete = self._apply_sealed(directory)
+                applied += done
+                if complete and not self._segment_seqs(directory):
+                    with self.app.app_context():
+                        db.session.execute(db.delete(EventLogCheckpoint).where(EventLogCheckpoint.log == directory))
+                        db.session.commit()
+                        db.session.remove()
+                    os.remove(os.path.join(directory, 'LOCK'))
+                    os.rmdir(directory)
+            except OSError:
+                pass  # Another process adopted it at the same time
+            finally:
+                lock_file.close()
+        return applied
+
+    def compact(self):
+        """Seal the active segment and apply every sealed one, plus orphaned logs.
+
+        Returns events applied.
+        """
+        with self._compact_lock:
+            if not self._is_open():
+                return 0
+            with self._lock:
+                if self._fd is not None:
+                    self._roll()
+                active = self._seq if self._fd is not None else self._seq + 1
+            applied, complete = self._apply_sealed(self.directory, below=active)
+            if complete:
+                applied += self._drain_orphans()
+            return applied
+
+    # Background threads
+
+    def _every(self, interval, fn):
+        while not self._stopped.wait(interval):
+            try:
+                fn()
+            except Exception:
+                logger.exception("Event log %s failed", fn.__name__)
+
+    def _compact_all(self):
+        # Background pass: this log, then the analytics rollups when due
+        self.compact()
+        compact_if_due(self.app)
+
+    def start(self):
+        if self._threads:
+            return
+        for name, interval, fn in (('fsync', self.fsync_interval, self.sync),
+                                   ('compact', self.compact_interval, self._compact_all)):
+            thread = threading.Thread(target=self._every, args=(interval, fn),
+                                      name=f'widgetic-eventlog-{name}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        atexit.register(self.stop)
+
+    def stop(self):
+        if not self._is_open():
+            return  # Never opened here (e.g. a CLI command), or opened by the parent before a fork
+        self._stopped.set()
+        for thread in self._threads:
+            if thread is not threading.current_thread():
+                thread.join(timeout=self.compact_interval + 5)
+        self.sync()
+        self.compact()
+        with self._lock:
+            if self._fd is not None:
+                os.close(self._fd)
+                if self._size == HEADER.size:
+                    os.remove(self._path(self._seq))  # The empty segment compact() just opened
+                self._fd = None
+            # Release the directory; a later add() opens it again
+            self._lock_file.close()
+            self._lock_file = None
+            self._pid = None
+
+
+def init_event_log(app):
+    """Create the event log if TRACKING_EVENT_LOG is enabled.
+
+    Nothing is opened until this process tracks its first event.
+    """
+    if not app.config.get('TRACKING_EVENT_LOG'):
+        return None
+    return EventLog(
+        app,
+        app.config['EVENT_LOG_DIR'] or os.path.join(app.instance_path, 'eventlog'),
+        segment_bytes=app.config['EVENT_LOG_SEGMENT_BYTES'],
+        fsync_interval=app.config['EVENT_LOG_FSYNC_INTERVAL'],
+        compact_interval=app.config['EVENT_LOG_COMPACT_INTERVAL']
+    )
@@ -0,0 +1,63 @@
+"""Application factory.
+
+`create_app()` builds the shared core: config, database, CORS, metrics and
+the public embed/tracking API. The full dashboard app (app.py) adds login,
+migrations, the CLI and its own routes on top. `create_app(edge=True)`
+stops at the core, so embed workers (edge.py) never import Flask-Login,
+Flask-Migrate, Werkzeug's password hashing or the dashboard code, and can
+be scaled separately with a smaller footprint.
+"""
+from flask import Flask
+from flask_cors import CORS
+from config import configs
+from models import db
+from database import init_database
+from instrumentation import init_instrumentation
+from metrics import registry, init_metrics, cache_hit_ratio
+from eventlog import init_event_log
+from tracking import init_write_behind
+from cache import init_cache
+from public_api import public_api, config_cache
+import os
+
+
+def create_app(config_name=None, edge=False):
+    app = Flask(__name__)
+    app.config.from_object(configs[config_name or os.environ.get('WIDGETIC_CONFIG', 'default')])
+    if app.config['CONFIG_CACHE_TTL'] is None and app.config['CACHE_BACKEND'] == 'memory':
+        # Dashboard invalidations never reach another process's memory cache
+        app.config['CONFIG_CACHE_TTL'] = app.config['MEMORY_CONFIG_CACHE_TTL']
+
+    db.init_app(app)
+    init_database(app)
+    init_cache(app)
+    # max_age lets browsers cache preflight results instead of re-sending OPTIONS
+    CORS(app, resources={r"/api/*": {"origins": "*"}}, max_age=app.config['CORS_MAX_AGE'])
+    init_instrumentation(app)
+    init_metrics(app)
+
+    # Tracking counts go to the event log or the write-behind buffer when either is enabled
+    ingest = init_event_log(app) or init_write_behind(app)
+    app.extensions['widgetic_ingest'] = ingest
+
+    app.register_blueprint(public_api)
+
+    registry.gauge('widgetic_config_cache_hit_ratio', 'Public config/embed cache hit ratio.', cache_hit_ratio(config_cache))
+    if ingest:
+        registry.gauge('widgetic_write_buffer_depth', 'Tracking counts waiting to be applied to the database.', ingest.depth)
+
+    if edge:
+        return app
+
+    from flask_login import LoginManager
+    from flask_migrate import Migrate
+    from access import load_user
+    from commands import widgetic_cli
+
+    Migrate(app, db)
+    login_manager = LoginManager(app)
+    login_manager.login_view = 'login'
+    # Cached user loader (see access.py)
+    login_manager.user_loader(load_user)
+    app.cli.add_command(widgetic_cli)
+    return app
@@ -0,0 +1,76 @@
+"""Opt-in per-request SQL instrumentation.
+
+Enabled with SQL_INSTRUMENTATION. Hooks SQLAlchemy cursor events to count
+the statements each request issues and the time spent in them, reports
+both in a Server-Timing response header, and logs statements slower
+than SLOW_QUERY_THRESHOLD_MS together with the route that issued them.
+This surfaces N+1 patterns hidden behind lazy relationships in templates.
+"""
+from flask import g, request, has_request_context
+from sqlalchemy import event
+from models import db
+import logging
+import time
+
+logger = logging.getLogger('widgetic.sql')
+
+
+def request_db_stats():
+    """(query count, seconds in the database) for the current request."""
+    return g.get('_sql_count', 0), g.get('_sql_time', 0.0)
+
+
+def track_query_time(app):
+    """Install the cursor listeners feeding `request_db_stats`. Idempotent."""
+    if 'widgetic_query_timer' in app.extensions:
+        return
+    app.extensions['widgetic_query_timer'] = True
+    log_slow = app.config['SQL_INSTRUMENTATION']
+    threshold = app.config['SLOW_QUERY_THRESHOLD_MS'] / 1000.0
+
+    # Start times live on the statement's execution context rather than the
+    # connection, so a statement that raises (no after_cursor_execute) leaves
+    # nothing behind to be paired with the next one
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context._widgetic_query_start = time.perf_counter()
+
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        start = getattr(context, '_widgetic_query_start', None)
+        if start is None:
+            return
+        elapsed = time.perf_counter() - start
+        if not has_request_context():
+            # Background flushes and CLI commands only get slow-query logging
+            route = None
+        else:
+            g._sql_count = g.get('_sql_count', 0) + 1
+            g._sql_time = g.get('_sql_time', 0.0) + elapsed
+            route = f"{request.method} {request.url_rule.rule if request.url_rule else request.path}"
+        if log_slow and elapsed >= threshold:
+            logger.warning("Slow query (%.1f ms) from %s: %s", elapsed * 1000, route or 'background', statement)
+
+    with app.app_context():
+        engines = list(db.engines.values())
+    for engine in engines:
+        event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', after_cursor_execute)
+
+
+def init_instrumentation(app):
+    if not app.config['SQL_INSTRUMENTATION']:
+        return
+    track_query_time(app)
+
+    @app.before_request
+    def start_request_timer():
+        g._request_start = time.perf_counter()
+
+    @app.after_request
+    def add_server_timing(response):
+        count, seconds = request_db_stats()
+        timings = [f'db;dur={seconds * 1000:.1f};desc="{count} queries"']
+        if '_request_start' in g:
+            timings.append(f'app;dur={(time.perf_counter() - g._request_start) * 1000:.1f}')
+        response.headers.add('Server-Timing', ', '.join(timings))
+        return response
@@ -0,0 +1,205 @@
+"""In-process metrics registry exposed as Prometheus text at /metrics.
+
+Counters and fixed-bucket histograms are plain dicts behind one lock, so
+recording a request costs a bisect and a few increments. Gauges are
+callbacks evaluated at scrape time. Values are per process; with several
+workers, scrape each one (or aggregate with Prometheus' own sum()).
+"""
+from bisect import bisect_left
+from flask import Response, current_app, g, request, abort
+from cache import caches
+from instrumentation import track_query_time, request_db_stats
+import threading
+import time
+
+# Seconds; covers cached config hits (sub-ms) through slow dashboard pages
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+def _label_str(names, values):
+    if not names:
+        return ''
+    pairs = ','.join(
+        '{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+        for name, value in zip(names, values)
+    )
+    return '{' + pairs + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def collect(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        with self._lock:
+            items = sorted(self._values.items())
+        for label_values, value in items:
+            yield f"{self.name}{_label_str(self.labels, label_values)} {_format_value(value)}"
+
+
+class Histogram:
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        # label values -> [per-bucket counts (+Inf last), sum, count]
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(label_values)
+            if series is None:
+                series = self._values[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def collect(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            items = sorted((key, (list(counts), total, n)) for key, (counts, total, n) in self._values.items())
+        names = self.labels + ('le',)
+        for label_values, (counts, total, n) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                labels = _label_str(names, label_values + (_format_value(float(bound)),))
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = _label_str(self.labels, label_values)
+            yield f"{self.name}_sum{labels} {_format_value(total)}"
+            yield f"{self.name}_count{labels} {n}"
+
+
+class Gauge:
+    """Value read from `fn` at scrape time; `fn` may return None to skip."""
+
+    def __init__(self, name, help, fn):
+        self.name = name
+        self.help = help
+        self.fn = fn
+
+    def collect(self):
+        value = self.fn()
+        if value is None:
+            return
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} gauge"
+        yield f"{self.name} {_format_value(value)}"
+
+
+class CacheLookups:
+    """Hit and miss counts of every named cache (see cache.py), read at scrape time."""
+
+    name = 'widgetic_cache_lookups_total'
+    help = 'Cache lookups by cache and result.'
+
+    def collect(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        for name in sorted(caches):
+            cache = caches[name]
+            for result, value in (('hit', cache.hits), ('miss', cache.misses)):
+                yield f"{self.name}{_label_str(('cache', 'result'), (name, result))} {value}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+
+    def register(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help, labels=()):
+        return self.register(Counter(name, help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, help, labels, buckets))
+
+    def gauge(self, name, help, fn):
+        return self.register(Gauge(name, help, fn))
+
+    def render(self):
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.collect())
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+registry.register(CacheLookups())
+
+requests_total = registry.counter(
+    'widgetic_http_requests_total', 'HTTP requests by endpoint and status code.', ('endpoint', 'status'))
+request_errors_total = registry.counter(
+    'widgetic_http_request_errors_total', 'HTTP responses with a 5xx status, by endpoint.', ('endpoint',))
+request_duration = registry.histogram(
+    'widgetic_http_request_duration_seconds', 'Request latency by endpoint.', ('endpoint',))
+request_db_duration = registry.histogram(
+    'widgetic_http_request_db_seconds', 'Time spent in SQL per request, by endpoint.', ('endpoint',))
+request_queries = registry.histogram(
+    'widgetic_http_request_queries', 'SQL statements issued per request, by endpoint.', ('endpoint',),
+    buckets=(0, 1, 2, 3, 5, 10, 25, 50, 100))
+
+
+def cache_hit_ratio(cache):
+    """Gauge callback for a cache's hit ratio since its backend was set up."""
+    def ratio():
+        lookups = cache.hits + cache.misses
+        return cache.hits / lookups if lookups else None
+    return ratio
+
+
+def init_metrics(app):
+    """Record per-endpoint request metrics and serve them at /metrics."""
+    if not app.config['METRICS_ENABLED']:
+        return
+    track_query_time(app)
+
+    @app.before_request
+    def start_metrics_timer():
+        g._metrics_start = time.perf_counter()
+
+    @app.after_request
+    def record_request_metrics(response):
+        start = g.pop('_metrics_start', None)
+        if start is None:
+            return response
+        endpoint = request.endpoint or 'unmatched'
+        requests_total.inc(endpoint, response.status_code)
+        if response.status_code >= 500:
+            request_errors_total.inc(endpoint)
+        request_duration.observe(time.perf_counter() - start, endpoint)
+        count, seconds = request_db_stats()
+        request_db_duration.observe(seconds, endpoint)
+        request_queries.observe(count, endpoint)
+        return response
+
+    @app.route('/metrics')
+    def metrics():
+        token = current_app.config['METRICS_TOKEN']
+        if token and request.headers.get('Authorization') != f"Bearer {token}":
+            abort(401)
+        return Response(registry.render(), mimetype='text/plain; version=0.0.4')
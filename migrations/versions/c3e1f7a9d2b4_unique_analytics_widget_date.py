@@ -0,0 +1,68 @@
+"""unique analytics (widget_id, date)
+
+Revision ID: c3e1f7a9d2b4
+Revises: 18c5b8a4bb19
+Create Date: 2026-10-18 10:12:40.518204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c3e1f7a9d2b4'
+down_revision = '18c5b8a4bb19'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+
+    # The analytics table and widget.dismissals were originally created with
+    # db.create_all() rather than a migration; bring migrated databases in line.
+    if 'dismissals' not in {c['name'] for c in inspector.get_columns('widget')}:
+        with op.batch_alter_table('widget', schema=None) as batch_op:
+            batch_op.add_column(sa.Column('dismissals', sa.Integer(), nullable=True))
+
+    if not inspector.has_table('analytics'):
+        op.create_table('analytics',
+        sa.Column('id', sa.String(length=36), nullable=False),
+        sa.Column('widget_id', sa.String(length=36), nullable=False),
+        sa.Column('date', sa.Date(), nullable=False),
+        sa.Column('views', sa.Integer(), nullable=True),
+        sa.Column('clicks', sa.Integer(), nullable=True),
+        sa.Column('dismissals', sa.Integer(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['widget_id'], ['widget.id'], ),
+        sa.PrimaryKeyConstraint('id')
+        )
+
+    # Fold duplicate same-day rows into the one with the lowest id
+    for column in ('views', 'clicks', 'dismissals'):
+        op.execute(f"""
+            UPDATE analytics SET {column} = (
+                SELECT SUM(COALESCE(dup.{column}, 0)) FROM analytics dup
+                WHERE dup.widget_id = analytics.widget_id AND dup.date = analytics.date
+            )
+            WHERE id IN (
+                SELECT MIN(id) FROM analytics GROUP BY widget_id, date HAVING COUNT(*) > 1
+            )
+        """)
+    op.execute("""
+        DELETE FROM analytics WHERE id NOT IN (
+            SELECT keep_id FROM (
+                SELECT MIN(id) AS keep_id FROM analytics GROUP BY widget_id, date
+            ) keep
+        )
+    """)
+
+    with op.batch_alter_table('analytics', schema=None) as batch_op:
+        batch_op.create_index('ix_analytics_widget_id_date', ['widget_id', 'date'], unique=True)
+
+
+def downgrade():
+    with op.batch_alter_table('analytics', schema=None) as batch_op:
+        batch_op.drop_index('ix_analytics_widget_id_date')
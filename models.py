@@ -1,5 +1,4 @@
 from flask_sqlalchemy import SQLAlchemy
-from flask_login import UserMixin
 from datetime import datetime
 import uuid
 import enum
@@ -49,7 +48,7 @@ class WidgetStatus(enum.Enum):
 
 # Models
 
-class User(UserMixin, db.Model):
+class User(db.Model):
     id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
     email = db.Column(db.String(120), unique=True, nullable=False, index=True)
     password_hash = db.Column(db.String(128))
@@ -66,6 +65,36 @@ class User(UserMixin, db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
+    # Flask-Login's user interface, implemented here (same behaviour as
+    # UserMixin) so importing the models does not pull in Flask-Login
+    __hash__ = object.__hash__
+
+    @property
+    def is_active(self):
+        return True
+
+    @property
+    def is_authenticated(self):
+        return self.is_active
+
+    @property
+    def is_anonymous(self):
+        return False
+
+    def get_id(self):
+        return str(self.id)
+
+    def __eq__(self, other):
+        if isinstance(other, User):
+            return self.get_id() == other.get_id()
+        return NotImplemented
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        if equal is NotImplemented:
+            return NotImplemented
+        return not equal
+
 class Website(db.Model):
     id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
     public_key = db.Column(db.String(36), unique=True, default=lambda: str(uuid.uuid4()), index=True)
@@ -79,18 +108,33 @@ class Website(db.Model):
     
     # Pricing / Limits
     max_widgets = db.Column(db.Integer, default=3)
+
+    # Bumped on every settings or widget change that affects the public config
+    config_version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
     
     # Relationships
     members = db.relationship('WebsiteMember', backref='website', lazy=True)
     widgets = db.relationship('Widget', backref='website', lazy=True)
 
 class WebsiteMember(db.Model):
+    # Access checks look up memberships by user; website.members by website
+    __table_args__ = (
+        db.Index('ix_website_member_user_id_website_id', 'user_id', 'website_id'),
+        db.Index('ix_website_member_website_id', 'website_id'),
+    )
+
     id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
     user_id = db.Column(db.String(36), db.ForeignKey('user.id'), nullable=False)
     website_id = db.Column(db.String(36), db.ForeignKey('website.id'), nullable=False)
     role = db.Column(db.String(20), default="ADMIN") # ADMIN, EDITOR, VIEWER
 
 class Widget(db.Model):
+    # Serves the public config query (active widgets of a site, oldest first)
+    # and every per-website widget lookup via its website_id prefix
+    __table_args__ = (
+        db.Index('ix_widget_website_id_status_created_at', 'website_id', 'status', 'created_at'),
+    )
+
     id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
     public_key = db.Column(db.String(36), unique=True, default=lambda: str(uuid.uuid4()), index=True)
     website_id = db.Column(db.String(36), db.ForeignKey('website.id'), nullable=False)
@@ -114,13 +158,63 @@ class Widget(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
+class AnalyticsHourly(db.Model):
+    # Raw hourly buckets written by tracking; compacted into Analytics (see rollups.py)
+    __table_args__ = (
+        db.Index('ix_analytics_hourly_widget_id_hour', 'widget_id', 'hour', unique=True),
+        # Oldest hour still here (rollups.rollup_tables) and compaction's range scan
+        db.Index('ix_analytics_hourly_hour', 'hour'),
+    )
+
+    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    widget_id = db.Column(db.String(36), db.ForeignKey('widget.id'), nullable=False)
+    hour = db.Column(db.DateTime, nullable=False) # Truncated to the hour, UTC
+    views = db.Column(db.Integer, default=0)
+    clicks = db.Column(db.Integer, default=0)
+    dismissals = db.Column(db.Integer, default=0)
+    visitors = db.Column(db.LargeBinary) # HyperLogLog sketch of viewer ids (see hll.py)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
 class Analytics(db.Model):
+    # One row per widget per day, compacted from AnalyticsHourly
+    __table_args__ = (
+        db.Index('ix_analytics_widget_id_date', 'widget_id', 'date', unique=True),
+        db.Index('ix_analytics_date', 'date'),
+    )
+
     id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
     widget_id = db.Column(db.String(36), db.ForeignKey('widget.id'), nullable=False)
     date = db.Column(db.Date, nullable=False, default=datetime.utcnow)
     views = db.Column(db.Integer, default=0)
     clicks = db.Column(db.Integer, default=0)
     dismissals = db.Column(db.Integer, default=0)
+    visitors = db.Column(db.LargeBinary) # HyperLogLog sketch of viewer ids (see hll.py)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class AnalyticsMonthly(db.Model):
+    # Daily rows past the retention window, compacted per month
+    __table_args__ = (
+        db.Index('ix_analytics_monthly_widget_id_month', 'widget_id', 'month', unique=True),
+        # Newest compacted month (rollups.rollup_tables)
+        db.Index('ix_analytics_monthly_month', 'month'),
+    )
+
+    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    widget_id = db.Column(db.String(36), db.ForeignKey('widget.id'), nullable=False)
+    month = db.Column(db.Date, nullable=False) # First day of the month
+    views = db.Column(db.Integer, default=0)
+    clicks = db.Column(db.Integer, default=0)
+    dismissals = db.Column(db.Integer, default=0)
+    visitors = db.Column(db.LargeBinary) # HyperLogLog sketch of viewer ids (see hll.py)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
+
+class EventLogCheckpoint(db.Model):
+    # Last event log segment applied to the counters, per log directory (see eventlog.py)
+    log = db.Column(db.String(255), primary_key=True)
+    segment = db.Column(db.BigInteger, nullable=False, default=0) # Millisecond-scale sequence numbers
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
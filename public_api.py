@@ -0,0 +1,164 @@
+"""Public embed and tracking API: everything widget.js talks to.
+
+Kept free of dashboard dependencies (Flask-Login, templates, forms) so the
+edge app (see factory.py) can serve it on its own.
+"""
+from flask import Blueprint, current_app, request, jsonify, make_response
+from cache import Cache
+from embed import serialize_config, render_embed_script, content_etag, embed_cache_key
+from models import db, Website, Widget
+from tracking import (event_field, aggregate_events, aggregate_visitors, event_sketches, apply_counts,
+                      record_event, current_hour)
+import json
+
+public_api = Blueprint('public_api', __name__)
+
+# Serialized public config per website: public_key -> (body bytes, etag).
+# Sized from CONFIG_CACHE_SIZE by the app factory.
+config_cache = Cache('config', size_setting='CONFIG_CACHE_SIZE')
+
+
+def ingest_buffer():
+    """The app's event log or write-behind buffer, or None when tracking writes directly."""
+    return current_app.extensions.get('widgetic_ingest')
+
+
+def get_cached_config(public_key):
+    """Return (body bytes, etag) for a website's public config, or None."""
+    cached = config_cache.get(public_key)
+    if cached is None:
+        website = Website.query.filter_by(public_key=public_key).first()
+        if not website:
+            return None
+
+        body = serialize_config(website)
+        cached = (body, content_etag(body))
+        config_cache.set(public_key, cached, ttl=current_app.config['CONFIG_CACHE_TTL'])
+    return cached
+
+@public_api.route('/api/website/<public_key>/config')
+def get_website_config(public_key):
+    cached = get_cached_config(public_key)
+    if cached is None:
+        return jsonify({"error": "Website not found"}), 404
+
+    body, etag = cached
+    response = make_response(body)
+    response.mimetype = 'application/json'
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = f"public, max-age={current_app.config['CONFIG_MAX_AGE']}"
+    # Answers If-None-Match with 304 Not Modified
+    return response.make_conditional(request)
+
+# Embed script with the website config baked in, saving the config round trip.
+# The two-step static/widget.js?key=... path keeps working alongside it.
+@public_api.route('/embed/<public_key>.js')
+def get_embed_script(public_key):
+    cache_key = embed_cache_key(public_key)
+    cached = config_cache.get(cache_key)
+    if cached is None:
+        config = get_cached_config(public_key)
+        if config is None:
+            response = make_response('console.error("Widgetic: Website not found");\n', 404)
+            response.mimetype = 'application/javascript'
+            return response
+
+        script = render_embed_script(public_key, config[0])
+        cached = (script, content_etag(script))
+        config_cache.set(cache_key, cached, ttl=current_app.config['CONFIG_CACHE_TTL'])
+
+    script, etag = cached
+    response = make_response(script)
+    response.mimetype = 'application/javascript'
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = (
+        f"public, max-age={current_app.config['EMBED_MAX_AGE']}, "
+        f"stale-while-revalidate={current_app.config['EMBED_STALE_WHILE_REVALIDATE']}"
+    )
+    return response.make_conditional(request)
+
+# 1x1 transparent GIF returned by the tracking pixel
+TRACKING_PIXEL = (
+    b'GIF89a\x01\x00\x01\x00\x80\x00\x00\x00\x00\x00\x00\x00\x00'
+    b'!\xf9\x04\x01\x00\x00\x00\x00,\x00\x00\x00\x00\x01\x00\x01\x00\x00\x02\x02D\x01\x00;'
+)
+
+def track_single_event(widget_id, event_type, visitor=None):
+    """Count one event for a widget. Returns False if the widget does not exist."""
+    field = event_field(event_type)
+
+    # Write-behind / event log mode: only hand the count off, it is applied in the background
+    buffer = ingest_buffer()
+    if buffer:
+        if field:
+            hour = current_hour()
+            buffer.add({(widget_id, hour, field): 1}, event_sketches(widget_id, hour, field, visitor))
+        return True
+
+    if not field:
+        # Unknown event types are accepted but not counted
+        return db.session.get(Widget, widget_id) is not None
+
+    # Atomic UPDATE on the widget plus an UPSERT on the current hourly bucket
+    if not record_event(widget_id, field, current_hour(), visitor):
+        db.session.rollback()
+        return False
+
+    db.session.commit()
+    return True
+
+# Analytics Tracking Endpoint
+@public_api.route('/api/widget/<widget_id>/track', methods=['POST'])
+def track_widget_event(widget_id):
+    # Also accepts text/plain bodies, which are CORS "simple" requests and skip the preflight
+    data = request.get_json(force=True, silent=True)
+    if not isinstance(data, dict):
+        data = {}
+    event_type = data.get('type') # 'view', 'click' or 'dismiss'
+
+    if not track_single_event(widget_id, event_type, data.get('visitor')):
+        return jsonify({"error": "Widget not found"}), 404
+    return jsonify({"success": True})
+
+# Tracking Pixel: GET /api/widget/<id>/pixel.gif?type=view&visitor=..., never preflighted
+@public_api.route('/api/widget/<widget_id>/pixel.gif')
+def track_widget_pixel(widget_id):
+    found = track_single_event(widget_id, request.args.get('type'), request.args.get('visitor'))
+
+    response = make_response(TRACKING_PIXEL, 200 if found else 404)
+    response.mimetype = 'image/gif'
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+# Batched Tracking Endpoint
+# Accepts either a bare list or {"events": [...], "visitor": id} of {widget_id, type, ts, visitor}
+@public_api.route('/api/track/batch', methods=['POST'])
+def track_events_batch():
+    # widget.js posts text/plain (no preflight, and what sendBeacon sends);
+    # form posts may carry the JSON in an "events" field
+    if request.form.get('events'):
+        data = request.form.get('events')
+        try:
+            data = json.loads(data)
+        except ValueError:
+            data = None
+    else:
+        data = request.get_json(force=True, silent=True)
+    events = data.get('events') if isinstance(data, dict) else data
+    if not isinstance(events, list):
+        return jsonify({"error": "Expected a list of events"}), 400
+
+    max_events = current_app.config['TRACK_BATCH_MAX_EVENTS']
+    if len(events) > max_events:
+        return jsonify({"error": f"Batch exceeds {max_events} events"}), 413
+
+    counts = aggregate_events(events)
+    sketches = aggregate_visitors(events, data.get('visitor') if isinstance(data, dict) else None)
+    buffer = ingest_buffer()
+    if buffer:
+        buffer.add(counts, sketches)
+        return jsonify({"success": True, "accepted": sum(counts.values())})
+
+    accepted = apply_counts(counts, sketches=sketches)
+    db.session.commit()
+    return jsonify({"success": True, "accepted": accepted})
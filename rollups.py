@@ -0,0 +1,501 @@
+"""Analytics rollup tables: hourly -> daily -> monthly.
+
+Tracking writes hourly buckets (AnalyticsHourly). `compact` periodically
+(from the ingest background threads, see `compact_if_due`, or
+`flask widgetic compact`) folds closed hours older than ANALYTICS_HOURLY_RETENTION_HOURS into the
+daily Analytics rows, and days older than ANALYTICS_DAILY_RETENTION_DAYS
+into AnalyticsMonthly. Every count lives in exactly one table, always the
+coarsest one it has been compacted into, so `rollup_query` reads every
+table that can hold part of the range (see `rollup_tables`) with range
+filters, and the amount of data scanned stays flat however much history a
+site has.
+
+Each row also carries a HyperLogLog sketch of the visitors who viewed the
+widget in that bucket (see hll.py). Compaction merges sketches along with
+the counters, and `unique_visitors` unions them per bucket in Python,
+since a sketch cannot be summed in SQL. Counts of buckets that can no
+longer change are cached (`uniques_cache`), so each closed bucket's
+sketches are merged once rather than on every dashboard request.
+"""
+from datetime import datetime, timedelta
+from collections import Counter
+import time
+from sqlalchemy import func, bindparam, type_coerce, union_all
+from models import db, Widget, Analytics, AnalyticsHourly, AnalyticsMonthly
+from hll import HyperLogLog, union
+from cache import Cache
+
+COUNTER_FIELDS = ('views', 'clicks', 'dismissals')
+GRANULARITIES = ('hour', 'day', 'month')
+SERIES_GRANULARITIES = ('day', 'week', 'month')
+
+# Closed-bucket unique visitor counts; keys carry the website's version, bumped when its data is deleted
+uniques_cache = Cache('uniques', size_setting='UNIQUES_CACHE_SIZE')
+
+# Unique key (besides widget_id) of each rollup table
+BUCKET_COLUMNS = {
+    'analytics_hourly': 'hour',
+    'analytics': 'date',
+    'analytics_monthly': 'month'
+}
+
+
+def truncate_hour(when):
+    return when.replace(minute=0, second=0, microsecond=0)
+
+
+def month_start(day):
+    return day.replace(day=1)
+
+
+def counter_increments(table):
+    """SET clause adding b_<field> bind params onto each counter column."""
+    return {
+        field: func.coalesce(table.c[field], 0) + bindparam(f'b_{field}')
+        for field in COUNTER_FIELDS
+    }
+
+
+def counter_params(row_id, fields):
+    params = {f'b_{field}': fields[field] for field in COUNTER_FIELDS}
+    params['b_id'] = row_id
+    return params
+
+
+def upsert_counts(conn, table, rows):
+    """Add per-(widget_id, bucket) deltas to a rollup table, creating missing rows.
+
+    Uses INSERT ... ON CONFLICT DO UPDATE against the table's unique
+    (widget_id, bucket) index where the dialect supports it.
+    """
+    if not rows:
+        return
+    bucket = BUCKET_COLUMNS[table.name]
+    dialect = conn.dialect.name
+    if dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    elif dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        return _merge_counts(conn, table, bucket, rows)
+
+    stmt = insert(table)
+    set_ = {
+        field: func.coalesce(table.c[field], 0) + stmt.excluded[field]
+        for field in COUNTER_FIELDS
+    }
+    set_['updated_at'] = datetime.utcnow()
+    conn.execute(
+        stmt.on_conflict_do_update(index_elements=['widget_id', bucket], set_=set_),
+        rows
+    )
+
+
+def _merge_counts(conn, table, bucket, rows):
+    # Fallback for dialects without ON CONFLICT: read, then update or insert
+    existing = {}
+    result = conn.execute(
+        db.select(table.c.id, table.c.widget_id, table.c[bucket])
+        .where(table.c.widget_id.in_({row['widget_id'] for row in rows}))
+        .where(table.c[bucket].in_({row[bucket] for row in rows}))
+    )
+    for row in result:
+        existing.setdefault((row[1], row[2]), row[0])
+
+    updates = []
+    inserts = []
+    for row in rows:
+        row_id = existing.get((row['widget_id'], row[bucket]))
+        if row_id:
+            updates.append(counter_params(row_id, row))
+        else:
+            inserts.append(row)
+
+    if updates:
+        conn.execute(
+            table.update()
+            .where(table.c.id == bindparam('b_id'))
+            .values(**counter_increments(table)),
+            updates
+        )
+    if inserts:
+        conn.execute(table.insert(), inserts)
+
+
+def merge_visitor_sketches(conn, table, sketches):
+    """Union {(widget_id, bucket): HyperLogLog} into the `visitors` sketches of existing rows.
+
+    Runs in the caller's transaction, after the rows have been upserted.
+    """
+    if not sketches:
+        return
+    bucket = BUCKET_COLUMNS[table.name]
+    rows = conn.execute(
+        db.select(table.c.id, table.c.widget_id, table.c[bucket], table.c.visitors)
+        .where(table.c.widget_id.in_({widget_id for widget_id, _ in sketches}))
+        .where(table.c[bucket].in_({value for _, value in sketches}))
+        .with_for_update()
+    )
+    updates = []
+    for row_id, widget_id, value, stored in rows:
+        sketch = sketches.get((widget_id, value))
+        if sketch is not None:
+            merged = HyperLogLog(stored).update(sketch) if stored else sketch
+            updates.append({'b_id': row_id, 'b_visitors': merged.to_bytes()})
+    if updates:
+        conn.execute(
+            table.update().where(table.c.id == bindparam('b_id')).values(visitors=bindparam('b_visitors')),
+            updates
+        )
+
+
+# Compaction
+
+# Ids per DELETE when removing folded rows; stays under SQLite's bind parameter limit
+DELETE_BATCH = 500
+
+
+def _fold(conn, source, cutoff, target, to_bucket):
+    """Move rows of `source` older than `cutoff` into `target`.
+
+    Runs in the caller's transaction. Only the rows read are deleted, so a
+    row inserted after the read (e.g. a late event on a database without
+    row locks) stays for the next run. Returns the number of source rows
+    folded.
+    """
+    src_bucket = source.c[BUCKET_COLUMNS[source.name]]
+    rows = conn.execute(
+        db.select(source.c.id, source.c.widget_id, src_bucket, source.c.visitors,
+                  *[source.c[f] for f in COUNTER_FIELDS])
+        .where(src_bucket < cutoff)
+        .with_for_update()
+    )
+
+    folded = {}
+    sketches = {}
+    ids = []
+    for row_id, widget_id, bucket, visitors, *values in rows:
+        ids.append(row_id)
+        key = (widget_id, to_bucket(bucket))
+        sums = folded.setdefault(key, Counter())
+        for field, value in zip(COUNTER_FIELDS, values):
+            sums[field] += value or 0
+        if visitors:
+            sketches.setdefault(key, []).append(visitors)
+
+    if not ids:
+        return 0
+
+    target_bucket = BUCKET_COLUMNS[target.name]
+    upsert_counts(conn, target, [
+        {
+            'widget_id': widget_id,
+            target_bucket: bucket,
+            'views': sums['views'],
+            'clicks': sums['clicks'],
+            'dismissals': sums['dismissals']
+        }
+        for (widget_id, bucket), sums in folded.items()
+    ])
+    merge_visitor_sketches(conn, target, {key: union(group) for key, group in sketches.items()})
+    for i in range(0, len(ids), DELETE_BATCH):
+        conn.execute(source.delete().where(source.c.id.in_(ids[i:i + DELETE_BATCH])))
+    return len(ids)
+
+
+def compact(hourly_retention_hours, daily_retention_days, now=None):
+    """Fold old hourly rows into daily rows and old daily rows into monthly rows.
+
+    Only whole months leave the daily table. Commits on success and returns
+    (hourly rows folded, daily rows folded).
+    """
+    now = now or datetime.utcnow()
+    hour_cutoff = truncate_hour(now) - timedelta(hours=hourly_retention_hours)
+    day_cutoff = month_start(now.date() - timedelta(days=daily_retention_days))
+
+    conn = db.session.connection()
+    try:
+        hourly = _fold(conn, AnalyticsHourly.__table__, hour_cutoff,
+                       Analytics.__table__, lambda hour: hour.date())
+        daily = _fold(conn, Analytics.__table__, day_cutoff,
+                      AnalyticsMonthly.__table__, month_start)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return hourly, daily
+
+
+def compact_if_due(app):
+    """Run `compact` if ANALYTICS_COMPACT_INTERVAL seconds have passed since this process last did.
+
+    Called by the write-behind buffer and event log after each flush, so
+    deployments using either need no separate schedule. Concurrent runs in
+    several workers are safe: the rows being folded are locked (FOR UPDATE)
+    or, on SQLite, the later writer fails and retries next time. Returns
+    `compact`'s result, or None if it was not due or failed.
+    """
+    interval = app.config['ANALYTICS_COMPACT_INTERVAL']
+    if not interval:
+        return None
+    now = time.monotonic()
+    last = app.extensions.get('widgetic_last_compaction')
+    if last is not None and now - last < interval:
+        return None
+    app.extensions['widgetic_last_compaction'] = now
+
+    with app.app_context():
+        try:
+            return compact(app.config['ANALYTICS_HOURLY_RETENTION_HOURS'],
+                           app.config['ANALYTICS_DAILY_RETENTION_DAYS'])
+        except Exception:
+            app.logger.exception("Analytics compaction failed")
+            return None
+        finally:
+            db.session.remove()
+
+
+# Reading
+
+def _hour(column, dialect):
+    if dialect == 'postgresql':
+        return func.date_trunc('hour', db.cast(column, db.DateTime))
+    # One text form for DATETIME and DATE columns alike, so buckets from
+    # different tables compare (and GROUP BY) equal
+    return type_coerce(func.strftime('%Y-%m-%d %H:00:00', column), db.DateTime)
+
+
+def _day(column, dialect):
+    if dialect == 'postgresql':
+        return db.cast(column, db.Date)
+    # SQLite keeps dates as 'YYYY-MM-DD' text, so date() lines up with Date columns
+    return type_coerce(func.date(column), db.Date)
+
+
+def _month(column, dialect):
+    if dialect == 'postgresql':
+        return db.cast(func.date_trunc('month', column), db.Date)
+    return type_coerce(func.strftime('%Y-%m-01', column), db.Date)
+
+
+def _week(column, dialect):
+    # Weeks start on Monday, matching Postgres date_trunc('week')
+    if dialect == 'postgresql':
+        return db.cast(func.date_trunc('week', column), db.Date)
+    return type_coerce(func.date(column, 'weekday 0', '-6 days'), db.Date)
+
+
+def _filter_rollup(stmt, table, start=None, end=None, website_id=None, widget_ids=None):
+    # Range and widget filters shared by the rollup readers; `start`/`end` are inclusive dates
+    column = table.c[BUCKET_COLUMNS[table.name]]
+    hourly = table.name == 'analytics_hourly'
+    if start is not None:
+        lower = month_start(start) if table.name == 'analytics_monthly' else start
+        stmt = stmt.where(column >= (datetime.combine(lower, datetime.min.time()) if hourly else lower))
+    if end is not None:
+        upper = end + timedelta(days=1)
+        stmt = stmt.where(column < (datetime.combine(upper, datetime.min.time()) if hourly else upper))
+    if widget_ids is not None:
+        stmt = stmt.where(table.c.widget_id.in_(widget_ids))
+    if website_id is not None:
+        stmt = stmt.where(table.c.widget_id.in_(
+            db.select(Widget.id).where(Widget.website_id == website_id)
+        ))
+    return stmt
+
+
+def rollup_tables(start=None, end=None, session=None):
+    """The rollup tables that can hold data between the inclusive dates `start` and `end`.
+
+    The daily table is always read. The hourly table is skipped when the
+    range ends before its oldest hour, and the monthly table when the range
+    starts after its newest month; both bounds are single index lookups.
+    """
+    session = session or db.session
+    hourly = AnalyticsHourly.__table__
+    daily = Analytics.__table__
+    monthly = AnalyticsMonthly.__table__
+
+    tables = []
+    oldest = session.scalar(db.select(func.min(hourly.c.hour)))
+    if oldest is not None and (end is None or oldest.date() <= end):
+        tables.append(hourly)
+    tables.append(daily)
+    newest = session.scalar(db.select(func.max(monthly.c.month)))
+    if newest is not None and (start is None or month_start(start) <= newest):
+        tables.append(monthly)
+    return tables
+
+
+def rollup_query(granularity='day', start=None, end=None, website_id=None, widget_ids=None):
+    """Counters bucketed at `granularity` across all rollup tables.
+
+    Returns a Select with columns (bucket, widget_id, views, clicks,
+    dismissals), one row per widget per bucket. `start`/`end` are inclusive
+    dates. Data already compacted past the requested granularity shows up
+    in the coarser bucket it was compacted into (e.g. on the 1st of the
+    month for `day`).
+    """
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"Unknown granularity {granularity!r}")
+    dialect = db.session.get_bind().dialect.name
+
+    hourly = AnalyticsHourly.__table__
+    daily = Analytics.__table__
+    monthly = AnalyticsMonthly.__table__
+
+    def bucket_for(table):
+        column = table.c[BUCKET_COLUMNS[table.name]]
+        if granularity == 'hour':
+            # Compacted data has no hour; it lands on midnight of its bucket
+            return _hour(column, dialect)
+        if granularity == 'day':
+            return _day(column, dialect) if table is hourly else column
+        return _month(column, dialect) if table is not monthly else column
+
+    selects = [
+        _filter_rollup(db.select(
+            bucket_for(table).label('bucket'),
+            table.c.widget_id,
+            *[table.c[f].label(f) for f in COUNTER_FIELDS]
+        ), table, start, end, website_id, widget_ids)
+        for table in rollup_tables(start, end)
+    ]
+
+    combined = union_all(*selects).subquery('rollup')
+    return db.select(
+        combined.c.bucket,
+        combined.c.widget_id,
+        *[func.sum(func.coalesce(combined.c[f], 0)).label(f) for f in COUNTER_FIELDS]
+    ).group_by(combined.c.bucket, combined.c.widget_id)
+
+
+def series_query(granularity='day', start=None, end=None, website_id=None, widget_ids=None):
+    """Counters summed across widgets per bucket, ordered by bucket.
+
+    Supports SERIES_GRANULARITIES; weeks are built from day buckets in SQL.
+    Returns a Select with columns (bucket, views, clicks, dismissals).
+    """
+    if granularity not in SERIES_GRANULARITIES:
+        raise ValueError(f"Unknown granularity {granularity!r}")
+    dialect = db.session.get_bind().dialect.name
+
+    rollup = rollup_query(
+        'month' if granularity == 'month' else 'day',
+        start=start, end=end, website_id=website_id, widget_ids=widget_ids
+    ).subquery()
+    bucket = _week(rollup.c.bucket, dialect) if granularity == 'week' else rollup.c.bucket
+    return db.select(
+        bucket.label('bucket'),
+        *[func.sum(rollup.c[f]).label(f) for f in COUNTER_FIELDS]
+    ).group_by(bucket).order_by(bucket)
+
+
+def _python_bucket(granularity, table_name, value):
+    # Same bucketing as rollup_query/series_query, applied to fetched rows
+    if table_name == 'analytics_hourly':
+        if granularity == 'hour':
+            return value
+        value = value.date()
+    elif granularity == 'hour':
+        return datetime.combine(value, datetime.min.time())
+    if granularity == 'week':
+        return value - timedelta(days=value.weekday())
+    if granularity == 'month':
+        return month_start(value)
+    return value
+
+
+def _bucket_end(granularity, bucket):
+    if granularity == 'hour':
+        return bucket + timedelta(hours=1)
+    if granularity == 'day':
+        return bucket + timedelta(days=1)
+    if granularity == 'week':
+        return bucket + timedelta(days=7)
+    return (bucket + timedelta(days=32)).replace(day=1)
+
+
+def _as_datetime(value):
+    return value if isinstance(value, datetime) else datetime.combine(value, datetime.min.time())
+
+
+def unique_visitors(granularity='day', start=None, end=None, website_id=None, widget_ids=None,
+                    per_widget=False, session=None, closed_before=None):
+    """Estimated unique viewers per bucket, from the union of the rows' visitor sketches.
+
+    Accepts GRANULARITIES and SERIES_GRANULARITIES and buckets rows the
+    same way as `rollup_query`/`series_query`. Returns {bucket: count},
+    or {(bucket, widget_id): count} with `per_widget`; buckets without any
+    sketch are absent. Visitors are counted once per bucket however many
+    widgets (or hours) they viewed.
+
+    With `closed_before` (a datetime), `start` and `end`, buckets that lie
+    wholly inside the range and end by `closed_before` are served from
+    `uniques_cache`; only a partial first bucket and the range from the
+    first uncached bucket on are read.
+    """
+    if granularity not in GRANULARITIES + SERIES_GRANULARITIES:
+        raise ValueError(f"Unknown granularity {granularity!r}")
+    session = session or db.session
+
+    results = {}
+    cached_buckets = set()
+    ranges = [(start, end)]
+    cacheable = None
+    if closed_before is not None and start is not None and end is not None:
+        scope = (website_id, uniques_cache.version(website_id), tuple(widget_ids or ()), granularity, per_widget)
+        limit = min(_as_datetime(end + timedelta(days=1)), closed_before)
+
+        first = _python_bucket(granularity, 'analytics', start)
+        if _as_datetime(first) < _as_datetime(start):
+            first = _bucket_end(granularity, first)  # Partial bucket; never cached
+        bucket = first
+        while _as_datetime(_bucket_end(granularity, bucket)) <= limit:
+            cached = uniques_cache.get((scope, bucket))
+            if cached is None:
+                break
+            results.update(cached)
+            cached_buckets.add(bucket)
+            bucket = _bucket_end(granularity, bucket)
+
+        if bucket != first:
+            resume = bucket.date() if granularity == 'hour' else bucket
+            # The head is the partial first bucket, if any, and at least the first day, so
+            # that monthly rows of the start's month still land where rollup_query puts them
+            head_end = first - timedelta(days=1) if granularity != 'hour' and first > start else start
+            if resume <= head_end:
+                pass
+            elif resume <= end:
+                ranges = [(start, head_end), (resume, end)]
+            else:
+                ranges = [(start, head_end)]
+        cacheable = (scope, bucket, limit)
+
+    # Raw sketches per key, merged in one pass each below
+    sketches = {}
+    for range_start, range_end in ranges:
+        for table in rollup_tables(range_start, range_end, session):
+            stmt = _filter_rollup(db.select(
+                table.c[BUCKET_COLUMNS[table.name]], table.c.widget_id, table.c.visitors
+            ).where(table.c.visitors.is_not(None)), table, range_start, range_end, website_id, widget_ids)
+            for value, widget_id, visitors in session.execute(stmt):
+                bucket = _python_bucket(granularity, table.name, value)
+                key = (bucket, widget_id) if per_widget else bucket
+                sketches.setdefault(key, []).append(visitors)
+
+    by_bucket = {}
+    for key, group in sketches.items():
+        bucket = key[0] if per_widget else key
+        if bucket not in cached_buckets:
+            by_bucket.setdefault(bucket, {})[key] = union(group).count()
+    for counts in by_bucket.values():
+        results.update(counts)
+
+    if cacheable:
+        # Remember every closed whole bucket just read, including empty ones
+        scope, bucket, limit = cacheable
+        while _as_datetime(_bucket_end(granularity, bucket)) <= limit:
+            uniques_cache.set((scope, bucket), by_bucket.get(bucket, {}))
+            bucket = _bucket_end(granularity, bucket)
+    return results
@@ -0,0 +1,249 @@
+"""Synthetic dataset generator behind `flask widgetic seed`.
+
+Traffic is skewed the way real embeds are: website popularity follows a
+Zipf-like 1/rank^s curve, widgets within a site fall off the same way,
+and daily views get weekly seasonality plus noise. Everything is driven
+by one `random.Random(seed)`, ids included, so a given seed always
+produces the same database.
+
+Rows are generated in chunks and written with one executemany per table
+per chunk. On SQLite the seeding connection turns off fsync and enlarges
+the page cache, which is what makes multi-GB databases take minutes; the
+settings are restored before the connection goes back to the pool.
+
+Websites and widgets get the settings/content shapes the dashboard forms
+write (see `website_settings` and `create_widget` in app.py).
+"""
+from datetime import date, datetime, timedelta
+from werkzeug.security import generate_password_hash
+from models import (db, User, Website, WebsiteMember, Widget, Analytics,
+                    GlobalRole, UserStatus, WidgetType, WidgetStatus, WidgetPosition)
+import random
+import uuid
+
+SEED_PASSWORD = 'Seed@123'
+
+# Share of widgets in each status; the rest are ACTIVE
+STATUS_MIX = ((WidgetStatus.PAUSED, 0.1), (WidgetStatus.DRAFT, 0.05), (WidgetStatus.ARCHIVED, 0.05))
+
+# Relative traffic per weekday (Monday first)
+WEEKDAY_FACTOR = (1.1, 1.15, 1.1, 1.05, 1.0, 0.75, 0.7)
+
+# Daily views of the most popular widget on the most popular website
+PEAK_DAILY_VIEWS = 200000
+
+# (title, description, button text, button url) per type, as entered in the widget form
+CONTENT_BY_TYPE = {
+    WidgetType.ANNOUNCEMENT_BAR: ('Free shipping', 'Free shipping on orders over $50', 'Shop now', 'https://example.com/shipping'),
+    WidgetType.NOTIFICATION: ('New arrivals', 'Check out this week\'s picks', 'View', 'https://example.com/new'),
+    WidgetType.POPUP_MODAL: ('Join our newsletter', 'Get 10% off your first order', 'Subscribe', 'https://example.com/newsletter'),
+    WidgetType.SLIDE_IN: ('Need help?', 'Chat with our team', 'Start chat', 'https://example.com/support'),
+    WidgetType.FLOATING_BUTTON: ('Contact us', 'We usually reply within a day', 'Message us', 'https://example.com/contact'),
+    WidgetType.BANNER: ('Summer sale', 'Up to 40% off', 'See deals', 'https://example.com/sale')
+}
+
+# (background, text) colors of the website settings form
+COLOR_SCHEMES = (('#000000', '#ffffff'), ('#020617', '#f8fafc'), ('#1e40af', '#ffffff'), ('#ffffff', '#0f172a'))
+
+# Website positions offered by the settings form
+SITE_POSITIONS = ('TOP_LEFT', 'TOP_RIGHT', 'BOTTOM_LEFT', 'BOTTOM_RIGHT')
+
+
+def widget_content(widget_type, rng):
+    # Same keys create_widget stores
+    title, description, button_text, button_url = CONTENT_BY_TYPE[widget_type]
+    return {
+        'title': title,
+        'description': description,
+        'button_text': button_text,
+        'button_url': button_url,
+        'open_behavior': 'AUTO',
+        'loop_count': rng.choice((0, 0, 1, 3))  # 0 = show forever
+    }
+
+
+def website_settings(rng):
+    # Same shape website_settings writes
+    return {
+        'timing': {'showTime': rng.choice((2, 5, 10)), 'hideTime': rng.choice((5, 8, 15))},
+        'position': rng.choice(SITE_POSITIONS),
+        'style': dict(zip(('backgroundColor', 'textColor'), rng.choice(COLOR_SCHEMES))),
+        'behavior': {'showCloseButton': rng.random() < 0.7, 'showBranding': rng.random() < 0.5}
+    }
+
+
+# Seeding is restartable, so durability is not worth paying for here
+SQLITE_BULK_PRAGMAS = {'synchronous': 'OFF', 'cache_size': -262144, 'temp_store': 'MEMORY'}
+
+
+def _sqlite_bulk_pragmas(conn):
+    """Apply SQLITE_BULK_PRAGMAS to `conn`; returns the previous values."""
+    previous = {}
+    for pragma, value in SQLITE_BULK_PRAGMAS.items():
+        previous[pragma] = conn.exec_driver_sql(f'PRAGMA {pragma}').scalar()
+        conn.exec_driver_sql(f'PRAGMA {pragma} = {value}')
+    return previous
+
+
+def _restore_pragmas(conn, previous):
+    for pragma, value in previous.items():
+        conn.exec_driver_sql(f'PRAGMA {pragma} = {value}')
+
+
+ANALYTICS_COLUMNS = ('id', 'widget_id', 'date', 'views', 'clicks', 'dismissals', 'created_at', 'updated_at')
+
+
+def _insert_analytics(conn, rows):
+    if conn.dialect.name == 'sqlite':
+        # Straight to the driver: SQLAlchemy's per-row bind processing costs
+        # more than the insert itself. Dates are pre-formatted by the caller.
+        conn.exec_driver_sql(
+            f"INSERT INTO {Analytics.__tablename__} ({', '.join(ANALYTICS_COLUMNS)}) "
+            f"VALUES ({', '.join('?' * len(ANALYTICS_COLUMNS))})",
+            rows
+        )
+    else:
+        conn.execute(Analytics.__table__.insert(), [dict(zip(ANALYTICS_COLUMNS, row)) for row in rows])
+
+
+def seed_database(websites=1000, widgets_per_website=10, days=365, seed=42,
+                  websites_per_user=5, zipf_s=1.1, chunk_size=50000, progress=None):
+    """Bulk-insert users, websites, widgets and daily analytics.
+
+    Adds to whatever is already in the database (run `db.create_all()` or
+    the migrations first). Widget totals match the sum of their generated
+    Analytics rows. `progress`, if given, is called with (websites done,
+    analytics rows written) after each chunk. Returns a summary dict.
+    """
+    rng = random.Random(seed)
+    new_id = lambda: str(uuid.UUID(int=rng.getrandbits(128), version=4))
+    today = date.today()
+    now = datetime.utcnow()
+    types = list(WidgetType)
+
+    # Analytics rows are tuples in ANALYTICS_COLUMNS order; on SQLite their
+    # dates are stored the way SQLAlchemy would write them
+    sqlite = db.session.get_bind().dialect.name == 'sqlite'
+    calendar = [today - timedelta(days=offset) for offset in range(days)]
+    day_values = [day.isoformat() for day in calendar] if sqlite else calendar
+    stamp = now.isoformat(' ') if sqlite else now
+
+    # Popularity rank -> website, so the busiest sites are spread across users
+    ranks = list(range(1, websites + 1))
+    rng.shuffle(ranks)
+
+    password_hash = generate_password_hash(SEED_PASSWORD)
+    pending = {table: [] for table in ('user', 'website', 'member', 'widget', 'analytics')}
+    tables = {
+        'user': User.__table__,
+        'website': Website.__table__,
+        'member': WebsiteMember.__table__,
+        'widget': Widget.__table__,
+        'analytics': Analytics.__table__
+    }
+    written = {table: 0 for table in pending}
+
+    def flush():
+        # Own connection, so the bulk pragmas never leak to requests through the pool
+        with db.engine.connect() as conn:
+            previous = _sqlite_bulk_pragmas(conn) if sqlite else {}
+            try:
+                # Parents first so foreign keys hold on databases that enforce them
+                for name in ('user', 'website', 'member', 'widget', 'analytics'):
+                    rows = pending[name]
+                    if rows:
+                        if name == 'analytics':
+                            _insert_analytics(conn, rows)
+                        else:
+                            conn.execute(tables[name].insert(), rows)
+                        written[name] += len(rows)
+                        pending[name] = []
+                conn.commit()
+            finally:
+                conn.rollback()  # No-op after the commit; pragmas must be set outside a transaction
+                _restore_pragmas(conn, previous)
+
+    pending['user'].append({
+        'id': new_id(), 'email': f'seed-admin-{seed}@example.com', 'name': 'Seed Admin',
+        'password_hash': password_hash, 'global_role': GlobalRole.SUPERADMIN,
+        'status': UserStatus.ACTIVE, 'created_at': now, 'updated_at': now
+    })
+
+    user_id = None
+    for index, rank in enumerate(ranks):
+        if index % websites_per_user == 0:
+            user_id = new_id()
+            pending['user'].append({
+                'id': user_id, 'email': f'seed-user-{seed}-{index // websites_per_user}@example.com',
+                'name': f'Seed User {index // websites_per_user}', 'password_hash': password_hash,
+                'global_role': GlobalRole.USER, 'status': UserStatus.ACTIVE,
+                'created_at': now, 'updated_at': now
+            })
+
+        website_id = new_id()
+        site_weight = 1.0 / rank ** zipf_s
+        pending['website'].append({
+            'id': website_id, 'public_key': new_id(), 'name': f'Site {index}',
+            'domain': f'https://site{index}.example.com', 'created_at': now,
+            'settings': website_settings(rng),
+            'max_widgets': max(3, widgets_per_website), 'config_version': 1
+        })
+        pending['member'].append({'id': new_id(), 'user_id': user_id, 'website_id': website_id, 'role': 'ADMIN'})
+
+        for position in range(widgets_per_website):
+            widget_id = new_id()
+            widget_type = types[rng.randrange(len(types))]
+            base = PEAK_DAILY_VIEWS * site_weight / (position + 1) ** zipf_s
+            ctr = rng.uniform(0.005, 0.08)
+            dismiss_rate = rng.uniform(0.01, 0.1)
+            # Widgets went live at different times; no traffic before that
+            age = rng.randint(1, days) if days else 0
+
+            totals = [0, 0, 0]
+            for offset in range(age):
+                views = int(base * WEEKDAY_FACTOR[calendar[offset].weekday()] * rng.uniform(0.6, 1.4))
+                if not views:
+                    continue
+                clicks = int(views * ctr)
+                dismissals = int(views * dismiss_rate)
+                totals[0] += views
+                totals[1] += clicks
+                totals[2] += dismissals
+                pending['analytics'].append(
+                    (new_id(), widget_id, day_values[offset], views, clicks, dismissals, stamp, stamp)
+                )
+
+            status = WidgetStatus.ACTIVE
+            roll = rng.random()
+            for candidate, share in STATUS_MIX:
+                if roll < share:
+                    status = candidate
+                    break
+                roll -= share
+
+            pending['widget'].append({
+                'id': widget_id, 'public_key': new_id(), 'website_id': website_id,
+                'name': f'{widget_type.value.replace("_", " ").title()} {position + 1}',
+                # The form always saves BOTTOM_RIGHT and no style; placement comes from the website settings
+                'type': widget_type, 'status': status, 'position': WidgetPosition.BOTTOM_RIGHT,
+                'content': widget_content(widget_type, rng), 'style': None,
+                'views': totals[0], 'clicks': totals[1], 'dismissals': totals[2],
+                'created_by_id': user_id, 'created_at': now - timedelta(days=age), 'updated_at': now
+            })
+
+        if len(pending['analytics']) >= chunk_size:
+            flush()
+            if progress:
+                progress(index + 1, written['analytics'])
+
+    flush()
+    if progress:
+        progress(websites, written['analytics'])
+
+    return {
+        'users': written['user'],
+        'websites': written['website'],
+        'widgets': written['widget'],
+        'analytics_rows': written['analytics'],
+        'password': SEED_PASSWORD
+    }
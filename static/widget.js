@@ -9,14 +9,18 @@
        =============================== */
     const scriptSrc = document.currentScript?.src || "";
     const params = new URLSearchParams(scriptSrc.split("?")[1]);
-    const WEBSITE_KEY = params.get("key");
+
+    // Set by /embed/<key>.js, which ships this runtime with the config baked in
+    const INLINE = window.__WIDGETIC_INLINE__ || null;
+    const WEBSITE_KEY = INLINE ? INLINE.key : params.get("key");
 
     if (!WEBSITE_KEY) {
         console.error("Widgetic: No public key provided.");
         return;
     }
 
-    const API_BASE = "http://127.0.0.1:5000"; // Dev URL
+    // The embed script is served by the API host itself
+    const API_BASE = (INLINE && scriptSrc) ? new URL(scriptSrc).origin : "http://127.0.0.1:5000"; // Dev URL
     const HOST_ID = "widgetic-host";
 
     let globalSettings = {};
@@ -25,6 +29,17 @@
     let showingWidget = false;
     let autoCloseTimer = null;
 
+    // Tracking queue: events are batched and flushed to /api/track/batch
+    const TRACK_FLUSH_INTERVAL = 5000; // ms
+    const TRACK_MAX_QUEUE = 20;
+    let eventQueue = [];
+    let flushTimer = null;
+
+    // Anonymous per-browser id for unique visitor counts: random, not derived
+    // from anything about the visitor, and kept only in this site's storage
+    const VISITOR_KEY = "widgetic_visitor";
+    const VISITOR_ID = getVisitorId();
+
     /* ===============================
        STYLES
        =============================== */
@@ -241,22 +256,15 @@
         container.className = "widgetic-container";
         shadow.appendChild(container);
 
-        // Fetch Config
-        fetch(`${API_BASE}/api/website/${WEBSITE_KEY}/config`)
-            .then(res => res.json())
-            .then(data => {
-                if (data.error) {
-                    console.error("Widgetic Error:", data.error);
-                    return;
-                }
-                globalSettings = data.settings;
-                widgets = data.widgets;
-
-                if (widgets.length > 0) {
-                    startRotationList();
-                }
-            })
-            .catch(err => console.error("Widgetic: Failed to load config", err));
+        // Use the inline config if we have one, otherwise fetch it
+        if (INLINE && INLINE.config) {
+            applyConfig(INLINE.config);
+        } else {
+            fetch(`${API_BASE}/api/website/${WEBSITE_KEY}/config`)
+                .then(res => res.json())
+                .then(applyConfig)
+                .catch(err => console.error("Widgetic: Failed to load config", err));
+        }
 
         // Expose container for render functions
         window._widgeticContainer = container;
@@ -264,6 +272,19 @@
         window._widgeticShadow = shadow;
     }
 
+    function applyConfig(data) {
+        if (data.error) {
+            console.error("Widgetic Error:", data.error);
+            return;
+        }
+        globalSettings = data.settings;
+        widgets = data.widgets;
+
+        if (widgets.length > 0) {
+            startRotationList();
+        }
+    }
+
     if (document.readyState === "loading") {
         document.addEventListener("DOMContentLoaded", initWidget);
     } else {
@@ -570,12 +591,58 @@
         }
     }
 
+    function getVisitorId() {
+        const newId = () => (window.crypto && crypto.randomUUID)
+            ? crypto.randomUUID()
+            : Date.now().toString(36) + Math.random().toString(36).slice(2);
+        try {
+            let id = localStorage.getItem(VISITOR_KEY);
+            if (!id) {
+                id = newId();
+                localStorage.setItem(VISITOR_KEY, id);
+            }
+            return id;
+        } catch (e) {
+            return newId(); // Storage blocked: unique for this page view only
+        }
+    }
+
     function trackEvent(widgetId, type) {
-        fetch(`${API_BASE}/api/widget/${widgetId}/track`, {
+        eventQueue.push({ widget_id: widgetId, type: type, ts: Date.now() });
+
+        if (eventQueue.length >= TRACK_MAX_QUEUE) {
+            flushEvents();
+        } else if (!flushTimer) {
+            flushTimer = setTimeout(flushEvents, TRACK_FLUSH_INTERVAL);
+        }
+    }
+
+    function flushEvents(useBeacon = false) {
+        if (flushTimer) {
+            clearTimeout(flushTimer);
+            flushTimer = null;
+        }
+        if (eventQueue.length === 0) return;
+
+        const url = `${API_BASE}/api/track/batch`;
+        const body = JSON.stringify({ visitor: VISITOR_ID, events: eventQueue });
+        eventQueue = [];
+
+        // Beacons survive page unload; fall back to fetch if the browser refuses
+        if (useBeacon && navigator.sendBeacon && navigator.sendBeacon(url, body)) return;
+
+        // text/plain keeps this a CORS "simple" request, so no OPTIONS preflight
+        fetch(url, {
             method: "POST",
-            headers: { "Content-Type": "application/json" },
-            body: JSON.stringify({ type: type })
+            headers: { "Content-Type": "text/plain" },
+            body: body,
+            keepalive: true
         }).catch(err => console.error("Tracking failed", err));
     }
 
+    window.addEventListener("pagehide", () => flushEvents(true));
+    document.addEventListener("visibilitychange", () => {
+        if (document.visibilityState === "hidden") flushEvents(true);
+    });
+
 })();
@@ -0,0 +1,99 @@
+"""Export public configs and embed scripts to disk for static serving.
+
+Files are keyed by public_key under the output directory:
+
+    config/<public_key>.json   (+ .json.gz, .json.br)
+    embed/<public_key>.js      (+ .js.gz, .js.br)
+
+A plain web server (e.g. nginx with gzip_static/brotli_static) can then
+serve the embed hot path without going through Flask. The .br variants
+are only written when the optional `brotli` package is installed.
+"""
+from models import db, Website
+from embed import serialize_config, render_embed_script, load_widget_runtime, content_etag
+import gzip
+import json
+import os
+import tempfile
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Hash of the widget runtime the embed scripts were last built from
+RUNTIME_STAMP = '.runtime'
+
+
+def _write_atomic(path, data):
+    # Readers never see a half-written file
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+def _write_variants(path, data):
+    _write_atomic(path, data)
+    _write_atomic(path + '.gz', gzip.compress(data, compresslevel=9, mtime=0))
+    if brotli:
+        _write_atomic(path + '.br', brotli.compress(data))
+
+
+def _config_path(out_dir, public_key):
+    return os.path.join(out_dir, 'config', f'{public_key}.json')
+
+
+def export_website(website, out_dir, runtime=None):
+    """Write the config and embed script for one website."""
+    os.makedirs(os.path.join(out_dir, 'config'), exist_ok=True)
+    os.makedirs(os.path.join(out_dir, 'embed'), exist_ok=True)
+
+    body = serialize_config(website)
+    script = render_embed_script(website.public_key, body, runtime)
+    # Config last: its version is what the incremental export compares against
+    _write_variants(os.path.join(out_dir, 'embed', f'{website.public_key}.js'), script)
+    _write_variants(_config_path(out_dir, website.public_key), body)
+
+
+def exported_version(out_dir, public_key):
+    try:
+        with open(_config_path(out_dir, public_key), 'rb') as f:
+            return json.load(f).get('version')
+    except (OSError, ValueError):
+        return None
+
+
+def export_static(out_dir, full=False):
+    """Export every website whose config_version differs from what is on disk.
+
+    All websites are rewritten when `full` is set or when widget.js changed
+    since the last export. Returns (written, unchanged).
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    runtime = load_widget_runtime()
+    runtime_hash = content_etag(runtime)
+    stamp_path = os.path.join(out_dir, RUNTIME_STAMP)
+    try:
+        with open(stamp_path) as f:
+            runtime_changed = f.read().strip() != runtime_hash
+    except OSError:
+        runtime_changed = True
+
+    written = 0
+    unchanged = 0
+    rows = db.session.query(Website.id, Website.public_key, Website.config_version).all()
+    for website_id, public_key, version in rows:
+        if not full and not runtime_changed and exported_version(out_dir, public_key) == version:
+            unchanged += 1
+            continue
+        export_website(db.session.get(Website, website_id), out_dir, runtime)
+        written += 1
+
+    _write_atomic(stamp_path, runtime_hash.encode('ascii'))
+    return written, unchanged
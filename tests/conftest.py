@@ -0,0 +1,58 @@
+"""Shared fixtures: the full app on a throwaway SQLite database.
+
+The environment is set before `app` is imported, since config.py reads it
+at import time. Tracking is synchronous unless a test builds its own ingest.
+"""
+import os
+import sys
+import tempfile
+
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(prefix='widgetic-tests-'), 'test.db')
+os.environ['TRACKING_WRITE_BEHIND'] = '0'
+os.environ['TRACKING_EVENT_LOG'] = '0'
+os.environ['CACHE_BACKEND'] = 'memory'
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from app import app as flask_app
+from cache import caches
+from models import db, User, Website, WebsiteMember, Widget, WidgetStatus, GlobalRole
+
+
+@pytest.fixture
+def app():
+    with flask_app.app_context():
+        db.drop_all()
+        db.create_all()
+        for cache in caches.values():
+            cache.clear()
+        yield flask_app
+        db.session.remove()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def widget(app):
+    """An active widget on a website with one admin member."""
+    user = User(email='owner@example.com', name='Owner', global_role=GlobalRole.USER)
+    website = Website(name='Site', domain='https://example.com', settings={})
+    db.session.add_all([user, website])
+    db.session.flush()
+    db.session.add(WebsiteMember(user_id=user.id, website_id=website.id, role='ADMIN'))
+    widget = Widget(name='Widget', website_id=website.id, created_by_id=user.id, content={'title': 'Hi'},
+                    status=WidgetStatus.ACTIVE, views=0, clicks=0, dismissals=0)
+    db.session.add(widget)
+    db.session.commit()
+    return widget
+
+
+@pytest.fixture
+def member_client(client, widget):
+    """Test client logged in as the widget's website member."""
+    with client.session_transaction() as session:
+        session['_user_id'] = widget.created_by_id
+    return client
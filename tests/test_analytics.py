@@ -0,0 +1,106 @@
+import time
+from datetime import date, datetime, timedelta
+from urllib.parse import urlsplit, parse_qs
+import pytest
+from flask import template_rendered
+from app import series_cache
+from models import db, Widget, WidgetStatus, Analytics, AnalyticsHourly
+
+TODAY = datetime.utcnow().date()
+
+
+@pytest.fixture
+def rendered(app):
+    """Contexts of the templates rendered during the test."""
+    contexts = []
+
+    def record(sender, template, context, **extra):
+        contexts.append(context)
+
+    template_rendered.connect(record, app)
+    yield contexts
+    template_rendered.disconnect(record, app)
+
+
+@pytest.fixture
+def widgets(widget):
+    """Three widgets on the website, with a daily row each for the last two days."""
+    others = [Widget(name=f'Widget {i}', website_id=widget.website_id, created_by_id=widget.created_by_id,
+                     content={}, status=WidgetStatus.ACTIVE, views=0, clicks=0, dismissals=0) for i in (2, 3)]
+    db.session.add_all(others)
+    db.session.flush()
+    for w in [widget] + others:
+        for days_ago in (1, 2):
+            db.session.add(Analytics(widget_id=w.id, date=TODAY - timedelta(days=days_ago), views=days_ago))
+    db.session.commit()
+    return [widget] + others
+
+
+def table_rows(context):
+    return [(day, item['id']) for day in context['sorted_dates'] for _, item in context['grouped_data'][day]]
+
+
+def test_table_cursor_continues(member_client, rendered, widgets):
+    website_id = widgets[0].website_id
+    response = member_client.get(f'/website/{website_id}/analytics/table?limit=4')
+    assert response.status_code == 200
+    first, next_url = table_rows(rendered[-1]), rendered[-1]['next_url']
+    assert len(first) == 4 and next_url
+
+    response = member_client.get(next_url)
+    assert response.status_code == 200
+    second = table_rows(rendered[-1])
+    assert rendered[-1]['next_url'] is None
+
+    ids = sorted(w.id for w in widgets)
+    assert first + second == [(TODAY - timedelta(days=days_ago), widget_id)
+                              for days_ago in (1, 2) for widget_id in ids]
+
+
+@pytest.mark.parametrize('limit, page_size', [('0', 1), ('-5', 1), ('abc', None), ('100000', 500)])
+def test_table_limit_is_clamped(app, member_client, rendered, widget, limit, page_size):
+    page_size = page_size or app.config['ANALYTICS_PAGE_SIZE']
+    db.session.add_all(Analytics(widget_id=widget.id, date=TODAY - timedelta(days=i), views=1) for i in range(501))
+    db.session.commit()
+
+    response = member_client.get(f'/website/{widget.website_id}/analytics/table?limit={limit}&from=2000-01-01')
+
+    assert response.status_code == 200
+    assert len(table_rows(rendered[-1])) == page_size
+    assert parse_qs(urlsplit(rendered[-1]['next_url']).query)['limit'] == [str(page_size)]
+
+
+def series(client, website_id, start):
+    response = client.get(f'/api/website/{website_id}/analytics/series?from={start.isoformat()}')
+    assert response.status_code == 200
+    return dict(zip(response.json['timestamps'], response.json['views']))
+
+
+def test_series_spans_cached_prefix_and_live_tail(app, member_client, widgets, monkeypatch):
+    widget = widgets[0]
+    start = TODAY - timedelta(days=10)
+    db.session.add_all([
+        Analytics(widget_id=widget.id, date=start, views=100),
+        AnalyticsHourly(widget_id=widget.id, hour=datetime.combine(TODAY, datetime.min.time()), views=5),
+    ])
+    db.session.commit()
+
+    expected = {start.isoformat(): 100, TODAY.isoformat(): 5,
+                (TODAY - timedelta(days=1)).isoformat(): 3, (TODAY - timedelta(days=2)).isoformat(): 6}
+    assert series(member_client, widget.website_id, start) == expected
+
+    # A new event lands in the tail, which is recomputed once SERIES_CACHE_TTL has passed
+    assert member_client.post(f'/api/widget/{widget.id}/track', json={'type': 'view'}).status_code == 200
+    assert series(member_client, widget.website_id, start) == expected
+    later = time.monotonic() + app.config['SERIES_CACHE_TTL'] + 1
+    monkeypatch.setattr(time, 'monotonic', lambda: later)
+    misses = series_cache.misses
+    expected[TODAY.isoformat()] = 6
+    assert series(member_client, widget.website_id, start) == expected
+    assert series_cache.misses == misses + 1  # The closed prefix never expires
+
+    # Deleting a widget drops its rows from the cached prefix at once
+    assert member_client.post(f'/widget/{widgets[2].id}/delete').status_code == 302
+    expected[(TODAY - timedelta(days=1)).isoformat()] = 2
+    expected[(TODAY - timedelta(days=2)).isoformat()] = 4
+    assert series(member_client, widget.website_id, start) == expected
@@ -0,0 +1,148 @@
+import multiprocessing
+import time
+import pytest
+from cache import LRUCache, SQLiteCache, Cache, caches, init_cache
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def backend(request, tmp_path):
+    if request.param == 'memory':
+        return LRUCache(max_size=3)
+    return SQLiteCache(tmp_path / 'cache.sqlite3', 'test', max_size=3)
+
+
+def test_get_set_delete(backend):
+    assert backend.get('a') is None
+    backend.set('a', {'value': [1, 2]})
+    assert backend.get('a') == {'value': [1, 2]}
+    backend.delete('a')
+    assert backend.get('a') is None
+    assert (backend.hits, backend.misses) == (1, 2)
+
+
+def test_entries_expire(backend, monkeypatch):
+    backend.set('a', 1, ttl=10)
+    backend.set('b', 2)
+    later = time.time() + 11, time.monotonic() + 11
+    monkeypatch.setattr(time, 'time', lambda: later[0])
+    monkeypatch.setattr(time, 'monotonic', lambda: later[1])
+
+    assert backend.get('a') is None
+    assert backend.get('b') == 2
+
+
+def test_versions(backend):
+    assert backend.version('site') == 0
+    assert backend.bump('site') == 1
+    assert backend.bump('site') == 2
+    assert backend.version('site') == 2
+    assert backend.version('other') == 0
+
+
+def test_lru_evicts_least_recently_used():
+    cache = LRUCache(max_size=2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get('a')
+    cache.set('c', 3)
+
+    assert cache.get('b') is None
+    assert (cache.get('a'), cache.get('c')) == (1, 3)
+
+
+def test_sqlite_prune_keeps_newest(tmp_path):
+    cache = SQLiteCache(tmp_path / 'cache.sqlite3', 'test', max_size=2)
+    for key in 'abc':
+        cache.set(key, key)
+    cache.prune()
+
+    assert len(cache) == 2
+    assert cache.get('a') is None
+
+
+def test_sqlite_namespaces_are_separate(tmp_path):
+    first = SQLiteCache(tmp_path / 'cache.sqlite3', 'first')
+    second = SQLiteCache(tmp_path / 'cache.sqlite3', 'second')
+    first.set('key', 1)
+    first.bump('key')
+
+    assert second.get('key') is None
+    assert second.version('key') == 0
+    second.clear()
+    assert first.get('key') == 1
+
+
+def _invalidate(path, ready):
+    # Runs in another process
+    cache = SQLiteCache(path, 'test')
+    cache.set('fresh', 'from child')
+    cache.delete('stale')
+    ready.put(cache.bump('site'))
+
+
+def test_sqlite_cache_is_shared_between_processes(tmp_path):
+    path = str(tmp_path / 'cache.sqlite3')
+    cache = SQLiteCache(path, 'test')
+    cache.set('stale', 'from parent')
+    cache.bump('site')
+
+    context = multiprocessing.get_context('fork' if 'fork' in multiprocessing.get_all_start_methods() else 'spawn')
+    ready = context.Queue()
+    child = context.Process(target=_invalidate, args=(path, ready))
+    child.start()
+    assert ready.get(timeout=30) == 2
+    child.join(timeout=30)
+
+    assert child.exitcode == 0
+    assert cache.get('fresh') == 'from child'
+    assert cache.get('stale') is None
+    assert cache.version('site') == 2
+
+
+def test_init_cache_switches_backends(app, tmp_path):
+    cache = Cache('test-switch', size_setting='SERIES_CACHE_SIZE')
+    try:
+        app.config.update(CACHE_BACKEND='sqlite', CACHE_PATH=str(tmp_path / 'cache.sqlite3'))
+        init_cache(app)
+        assert isinstance(cache.backend, SQLiteCache)
+        assert cache.backend.max_size == app.config['SERIES_CACHE_SIZE']
+
+        app.config.update(CACHE_BACKEND='memory')
+        init_cache(app)
+        assert isinstance(cache.backend, LRUCache)
+
+        app.config.update(CACHE_BACKEND='redis')
+        with pytest.raises(ValueError):
+            init_cache(app)
+    finally:
+        del caches['test-switch']
+        app.config.update(CACHE_BACKEND='memory', CACHE_PATH=None)
+        init_cache(app)
+
+
+def test_embed_cache_is_keyed_by_runtime(app, client, widget):
+    from embed import embed_cache_key
+    from public_api import config_cache
+    public_key = widget.website.public_key
+
+    assert client.get(f'/embed/{public_key}.js').status_code == 200
+    assert config_cache.get(embed_cache_key(public_key)) is not None
+
+    # A deploy with a different widget.js must not reuse scripts from a shared cache
+    app.extensions['widgetic_runtime_hash'] = 'new-runtime'
+    try:
+        assert config_cache.get(embed_cache_key(public_key)) is None
+    finally:
+        del app.extensions['widgetic_runtime_hash']
+
+
+def test_memory_backend_expires_configs(app):
+    # Other workers' memory caches never see this process's invalidations
+    assert app.config['CACHE_BACKEND'] == 'memory'
+    assert app.config['CONFIG_CACHE_TTL'] == app.config['MEMORY_CONFIG_CACHE_TTL']
+
+
+def test_named_caches_take_their_configured_size(app):
+    for cache in caches.values():
+        assert cache.size_setting is not None, cache.name
+        assert cache.backend.max_size == app.config[cache.size_setting]
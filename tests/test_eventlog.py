@@ -0,0 +1,141 @@
+import os
+from datetime import datetime
+import pytest
+from eventlog import (EventLog, HEADER, MAGIC, VERSION, RECORD, SEGMENT_SUFFIX, WORKER_PREFIX,
+                      encode_counts, read_segment, fcntl)
+from models import db, Widget, AnalyticsHourly, EventLogCheckpoint
+
+HOUR = datetime(2026, 1, 5, 14)
+
+
+def write_segment(directory, seq, counts):
+    os.makedirs(directory, exist_ok=True)
+    data, _ = encode_counts(counts)
+    path = os.path.join(directory, f'{seq:016d}{SEGMENT_SUFFIX}')
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, RECORD.size, seq) + data)
+    return path
+
+
+def segments(directory):
+    return sorted(name for name in os.listdir(directory) if name.endswith(SEGMENT_SUFFIX))
+
+
+def views(widget_id):
+    db.session.expire_all()
+    return db.session.get(Widget, widget_id).views
+
+
+@pytest.fixture
+def log(app, tmp_path):
+    event_log = EventLog(app, tmp_path / 'eventlog', fsync_interval=3600, compact_interval=3600)
+    yield event_log
+    event_log.stop()
+
+
+def test_segment_round_trip(tmp_path, widget):
+    counts = {(widget.id, HOUR, 'views'): 70000, (widget.id, HOUR, 'clicks'): 3, ('not-a-uuid', HOUR, 'views'): 1}
+    path = write_segment(tmp_path, 7, counts)
+
+    seq, decoded, sketches = read_segment(path)
+    assert seq == 7
+    # Counts above a record's 16-bit limit span several records
+    assert decoded == {(widget.id, HOUR, 'views'): 70000, (widget.id, HOUR, 'clicks'): 3}
+    assert sketches == {}
+
+
+def test_torn_trailing_record_is_dropped(tmp_path, widget):
+    path = write_segment(tmp_path, 1, {(widget.id, HOUR, 'views'): 2})
+    with open(path, 'ab') as f:
+        f.write(b'\x01\x02\x03')
+
+    assert read_segment(path)[1] == {(widget.id, HOUR, 'views'): 2}
+
+
+def test_foreign_segment_is_rejected(tmp_path):
+    path = tmp_path / f'{1:016d}{SEGMENT_SUFFIX}'
+    path.write_bytes(HEADER.pack(b'NOPE', VERSION, RECORD.size, 1))
+
+    with pytest.raises(ValueError):
+        read_segment(path)
+
+
+def test_nothing_is_opened_until_the_first_event(log):
+    assert log.depth() == 0
+    assert log.compact() == 0
+    log.stop()
+    assert not os.path.exists(log.base_directory)
+
+
+def test_add_and_compact(log, widget):
+    log.add({(widget.id, HOUR, 'views'): 3, (widget.id, HOUR, 'clicks'): 1})
+
+    assert os.path.basename(log.directory) == f'{WORKER_PREFIX}{os.getpid()}'
+    assert log.depth() == 4
+    assert views(widget.id) == 0
+
+    assert log.compact() == 4
+    assert log.depth() == 0
+    assert views(widget.id) == 3
+    row = db.session.scalars(db.select(AnalyticsHourly)).one()
+    assert (row.hour, row.views, row.clicks) == (HOUR, 3, 1)
+
+    # Applied segments are deleted and the checkpoint points past them
+    checkpoint = db.session.get(EventLogCheckpoint, log.directory)
+    assert all(int(name[:16]) > checkpoint.segment for name in segments(log.directory))
+
+
+def test_segments_are_replayed_once(log, widget):
+    log.add({(widget.id, HOUR, 'views'): 1})
+    log.compact()
+    checkpoint = db.session.get(EventLogCheckpoint, log.directory).segment
+
+    # A crash between committing a segment and deleting it leaves it on disk
+    write_segment(log.directory, checkpoint, {(widget.id, HOUR, 'views'): 5})
+    log.compact()
+
+    assert views(widget.id) == 1
+    assert f'{checkpoint:016d}{SEGMENT_SUFFIX}' not in segments(log.directory)
+
+
+def test_new_segments_sort_after_the_checkpoint(app, tmp_path, widget):
+    # A checkpoint far ahead of the clock, e.g. after the files were lost
+    first = EventLog(app, tmp_path / 'eventlog')
+    first.add({(widget.id, HOUR, 'views'): 1})
+    first.compact()
+    db.session.merge(EventLogCheckpoint(log=first.directory, segment=first._seq + 10 ** 12))
+    db.session.commit()
+    first.stop()
+
+    second = EventLog(app, tmp_path / 'eventlog')
+    second.add({(widget.id, HOUR, 'views'): 1})
+    try:
+        assert second._seq > first._seq + 10 ** 12
+        second.compact()
+        assert views(widget.id) == 2
+    finally:
+        second.stop()
+
+
+@pytest.mark.skipif(fcntl is None, reason="needs flock to tell live workers from dead ones")
+def test_compaction_drains_logs_of_exited_workers(log, widget):
+    orphan = os.path.join(log.base_directory, f'{WORKER_PREFIX}999999999')
+    write_segment(orphan, 1, {(widget.id, HOUR, 'views'): 4})
+    write_segment(orphan, 2, {(widget.id, HOUR, 'dismissals'): 1})
+
+    log.add({(widget.id, HOUR, 'views'): 1})
+    log.compact()
+
+    assert views(widget.id) == 5
+    assert db.session.get(Widget, widget.id).dismissals == 1
+    assert not os.path.exists(orphan)
+    assert db.session.get(EventLogCheckpoint, orphan) is None
+
+
+def test_stop_applies_pending_events(app, tmp_path, widget):
+    event_log = EventLog(app, tmp_path / 'eventlog')
+    event_log.add({(widget.id, HOUR, 'views'): 2})
+    event_log.stop()
+
+    assert views(widget.id) == 2
+    assert segments(event_log.directory) == []
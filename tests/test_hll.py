@@ -0,0 +1,88 @@
+from datetime import datetime, date
+import pytest
+from eventlog import encode_counts, decode_records
+from hll import HyperLogLog, REGISTERS, union
+from models import db, Analytics, AnalyticsHourly
+from rollups import compact, unique_visitors, uniques_cache
+from tracking import apply_counts
+
+HOUR = datetime(2026, 1, 5, 14)
+
+
+def sketch_of(visitors):
+    sketch = HyperLogLog()
+    for visitor in visitors:
+        sketch.add(visitor)
+    return sketch
+
+
+@pytest.mark.parametrize('n', [0, 1, 10, 1000, 20000])
+def test_count_is_within_error(n):
+    estimate = sketch_of(f'visitor-{i}' for i in range(n)).count()
+    # 1.04 / sqrt(1024) is about 3%; allow three standard errors
+    assert abs(estimate - n) <= max(1, 0.1 * n)
+
+
+def test_duplicates_count_once():
+    assert sketch_of(['a', 'b', 'a', 'a']).count() == 2
+
+
+def test_merge_is_the_union():
+    left = sketch_of(f'v{i}' for i in range(0, 600))
+    right = sketch_of(f'v{i}' for i in range(400, 1000))
+    both = sketch_of(f'v{i}' for i in range(1000))
+
+    assert HyperLogLog(left.to_bytes()).update(right).to_bytes() == both.to_bytes()
+    assert union([left.to_bytes(), None, right.to_bytes()]).to_bytes() == both.to_bytes()
+    assert union([]).count() == 0
+
+
+def test_bytes_round_trip():
+    sketch = sketch_of(['a', 'b', 'c'])
+    assert len(sketch.to_bytes()) == REGISTERS
+    assert HyperLogLog(sketch.to_bytes()).registers == sketch.registers
+    with pytest.raises(ValueError):
+        HyperLogLog(b'\x00' * 10)
+
+
+def test_event_log_records_round_trip(widget):
+    sketch = sketch_of(f'v{i}' for i in range(500))
+    data, events = encode_counts({(widget.id, HOUR, 'views'): 500}, {(widget.id, HOUR): sketch})
+
+    counts, sketches = decode_records(data)
+    assert events == 500
+    assert counts == {(widget.id, HOUR, 'views'): 500}
+    assert sketches[(widget.id, HOUR)].registers == sketch.registers
+
+
+def test_sketches_survive_apply_and_compaction(widget):
+    for hour, visitors in ((datetime(2026, 1, 5, 9), range(0, 300)), (datetime(2026, 1, 5, 17), range(200, 500))):
+        sketch = sketch_of(f'v{i}' for i in visitors)
+        apply_counts({(widget.id, hour, 'views'): len(visitors)}, sketches={(widget.id, hour): sketch})
+    db.session.commit()
+    before = unique_visitors('day', date(2026, 1, 5), date(2026, 1, 5), widget_ids=[widget.id])
+
+    compact(hourly_retention_hours=0, daily_retention_days=10000, now=datetime(2026, 1, 7))
+    assert db.session.scalar(db.select(db.func.count()).select_from(AnalyticsHourly)) == 0
+    assert db.session.scalars(db.select(Analytics)).one().views == 600
+    after = unique_visitors('day', date(2026, 1, 5), date(2026, 1, 5), widget_ids=[widget.id])
+
+    assert before == after
+    assert abs(after[date(2026, 1, 5)] - 500) <= 25
+
+
+def test_closed_buckets_are_cached(widget):
+    for day in (3, 4, 5):
+        hour = datetime(2026, 1, day, 12)
+        apply_counts({(widget.id, hour, 'views'): 1}, sketches={(widget.id, hour): sketch_of([f'day{day}'])})
+    db.session.commit()
+    closed_before = datetime(2026, 1, 5)
+
+    first = unique_visitors('day', date(2026, 1, 1), date(2026, 1, 5), website_id=widget.website_id,
+                            closed_before=closed_before)
+    misses = uniques_cache.misses
+    second = unique_visitors('day', date(2026, 1, 1), date(2026, 1, 5), website_id=widget.website_id,
+                             closed_before=closed_before)
+
+    assert first == second == {date(2026, 1, day): 1 for day in (3, 4, 5)}
+    assert uniques_cache.misses == misses  # Jan 1-4 came from the cache
@@ -0,0 +1,92 @@
+"""Hot-path queries must use indexes.
+
+Each route's statements are captured and run through EXPLAIN QUERY PLAN;
+a full table scan (e.g. after a dropped index or a query rewrite) fails.
+"""
+from datetime import date, datetime, timedelta
+import re
+import pytest
+from sqlalchemy import event
+from models import db, Analytics, AnalyticsHourly, AnalyticsMonthly
+
+FULL_SCAN = re.compile(r'^SCAN (\w+)$')
+
+START = (date.today() - timedelta(days=30)).isoformat()
+
+# (name, method, path, body); paths are formatted with the fixture's ids
+HOT_REQUESTS = [
+    ('config', 'GET', '/api/website/{public_key}/config', None),
+    ('embed', 'GET', '/embed/{public_key}.js', None),
+    ('track', 'POST', '/api/widget/{widget_id}/track', {'type': 'view', 'visitor': 'plans-visitor'}),
+    ('pixel', 'GET', '/api/widget/{widget_id}/pixel.gif?type=click', None),
+    ('batch', 'POST', '/api/track/batch',
+     {'visitor': 'plans-visitor', 'events': [{'widget_id': '{widget_id}', 'type': 'view'}]}),
+    ('dashboard', 'GET', '/dashboard', None),
+    ('website', 'GET', '/website/{website_id}', None),
+    ('analytics', 'GET', '/website/{website_id}/analytics', None),
+    ('table', 'GET', '/website/{website_id}/analytics/table?from=' + START + '&widget={widget_id}', None),
+    ('series', 'GET', '/api/website/{website_id}/analytics/series?granularity=week', None),
+    ('export', 'GET', '/website/{website_id}/analytics/export?format=ndjson', None),
+    ('stats', 'GET', '/website/{website_id}/stats', None),
+]
+
+
+def full_scans(conn, statement, parameters):
+    """Names of real tables EXPLAIN QUERY PLAN reports as full scans."""
+    scans = []
+    for row in conn.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, tuple(parameters)):
+        match = FULL_SCAN.match(row[3])
+        if match and match.group(1) in db.metadata.tables:
+            scans.append(match.group(1))
+    return scans
+
+
+@pytest.fixture
+def history(widget):
+    """Rows in every rollup table, so the analytics routes run all their queries."""
+    today = date.today()
+    db.session.add_all([
+        AnalyticsHourly(widget_id=widget.id, hour=datetime.combine(today, datetime.min.time()), views=1),
+        Analytics(widget_id=widget.id, date=today - timedelta(days=3), views=2),
+        AnalyticsMonthly(widget_id=widget.id, month=(today - timedelta(days=500)).replace(day=1), views=3),
+    ])
+    db.session.commit()
+    return widget
+
+
+@pytest.fixture
+def captured(app):
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().split(None, 1)[0].upper() in ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH'):
+            statements.append((statement, parameters[0] if executemany else parameters))
+
+    event.listen(db.engine, 'before_cursor_execute', capture)
+    yield statements
+    event.remove(db.engine, 'before_cursor_execute', capture)
+
+
+def fill(value, ids):
+    if isinstance(value, str):
+        return value.format(**ids)
+    if isinstance(value, dict):
+        return {key: fill(item, ids) for key, item in value.items()}
+    if isinstance(value, list):
+        return [fill(item, ids) for item in value]
+    return value
+
+
+@pytest.mark.parametrize('name, method, path, body', HOT_REQUESTS, ids=[request[0] for request in HOT_REQUESTS])
+def test_hot_path_uses_indexes(member_client, history, captured, name, method, path, body):
+    ids = {'public_key': history.website.public_key, 'website_id': history.website_id, 'widget_id': history.id}
+    response = member_client.open(fill(path, ids), method=method, json=fill(body, ids))
+    response.get_data()
+
+    assert response.status_code < 400
+    assert captured
+    scans = []
+    with db.engine.connect() as conn:
+        for statement, parameters in captured:
+            scans += [(table, ' '.join(statement.split())) for table in full_scans(conn, statement, parameters)]
+    assert scans == []
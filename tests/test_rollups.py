@@ -0,0 +1,134 @@
+from datetime import datetime, date
+import csv
+import io
+import pytest
+from models import db, Analytics, AnalyticsHourly, AnalyticsMonthly
+from rollups import rollup_query, series_query, compact, compact_if_due
+
+
+@pytest.fixture
+def spread(widget):
+    """Counts for one widget in all three tables, overlapping on 2026-01-05 and January."""
+    db.session.add_all([
+        AnalyticsHourly(widget_id=widget.id, hour=datetime(2026, 1, 5, 0), views=5, clicks=1),
+        AnalyticsHourly(widget_id=widget.id, hour=datetime(2026, 1, 5, 13), views=1),
+        Analytics(widget_id=widget.id, date=date(2026, 1, 5), views=2, dismissals=1),
+        Analytics(widget_id=widget.id, date=date(2026, 1, 6), views=4),
+        AnalyticsMonthly(widget_id=widget.id, month=date(2025, 12, 1), views=30),
+    ])
+    db.session.commit()
+    return widget
+
+
+def rows(granularity, widget, start=None, end=None):
+    return [tuple(row) for row in db.session.execute(
+        rollup_query(granularity, start=start, end=end, widget_ids=[widget.id]).order_by('bucket')
+    )]
+
+
+def test_rollup_hour_merges_buckets_across_tables(spread):
+    assert rows('hour', spread) == [
+        (datetime(2025, 12, 1, 0), spread.id, 30, 0, 0),
+        (datetime(2026, 1, 5, 0), spread.id, 7, 1, 1),
+        (datetime(2026, 1, 5, 13), spread.id, 1, 0, 0),
+        (datetime(2026, 1, 6, 0), spread.id, 4, 0, 0),
+    ]
+
+
+def test_rollup_day_and_month(spread):
+    assert rows('day', spread) == [
+        (date(2025, 12, 1), spread.id, 30, 0, 0),
+        (date(2026, 1, 5), spread.id, 8, 1, 1),
+        (date(2026, 1, 6), spread.id, 4, 0, 0),
+    ]
+    assert rows('month', spread) == [
+        (date(2025, 12, 1), spread.id, 30, 0, 0),
+        (date(2026, 1, 1), spread.id, 12, 1, 1),
+    ]
+
+
+def test_rollup_range_filters(spread):
+    assert rows('day', spread, start=date(2026, 1, 6), end=date(2026, 1, 6)) == [
+        (date(2026, 1, 6), spread.id, 4, 0, 0),
+    ]
+    # Compacted months are included whole once the range touches them
+    assert rows('month', spread, start=date(2025, 12, 15), end=date(2026, 1, 5)) == [
+        (date(2025, 12, 1), spread.id, 30, 0, 0),
+        (date(2026, 1, 1), spread.id, 8, 1, 1),
+    ]
+
+
+def test_rollup_rejects_unknown_granularity():
+    with pytest.raises(ValueError):
+        rollup_query('minute')
+
+
+def test_series_week(spread):
+    result = [tuple(row) for row in db.session.execute(
+        series_query('week', start=date(2026, 1, 1), end=date(2026, 1, 11), widget_ids=[spread.id])
+    )]
+    # 2026-01-05 is a Monday
+    assert result == [(date(2026, 1, 5), 12, 1, 1)]
+
+
+def table(model, bucket):
+    return sorted((getattr(row, bucket), row.views) for row in db.session.scalars(db.select(model)))
+
+
+def test_compact_folds_old_rows(widget):
+    db.session.add_all([
+        AnalyticsHourly(widget_id=widget.id, hour=datetime(2026, 3, 1, 9), views=1),
+        AnalyticsHourly(widget_id=widget.id, hour=datetime(2026, 3, 1, 20), views=2),
+        AnalyticsHourly(widget_id=widget.id, hour=datetime(2026, 3, 3, 11), views=4),
+        Analytics(widget_id=widget.id, date=date(2026, 3, 1), views=8),
+        Analytics(widget_id=widget.id, date=date(2026, 1, 10), views=16),
+        Analytics(widget_id=widget.id, date=date(2026, 1, 20), views=32),
+        Analytics(widget_id=widget.id, date=date(2026, 2, 27), views=64),
+        AnalyticsMonthly(widget_id=widget.id, month=date(2026, 1, 1), views=128),
+    ])
+    db.session.commit()
+    before = rows('month', widget)
+
+    assert compact(hourly_retention_hours=24, daily_retention_days=30, now=datetime(2026, 3, 3, 12)) == (2, 2)
+
+    # Hours before 2026-03-02 12:00 joined the day; whole months before February left the daily table
+    assert table(AnalyticsHourly, 'hour') == [(datetime(2026, 3, 3, 11), 4)]
+    assert table(Analytics, 'date') == [(date(2026, 2, 27), 64), (date(2026, 3, 1), 11)]
+    assert table(AnalyticsMonthly, 'month') == [(date(2026, 1, 1), 176)]
+    assert rows('month', widget) == before
+
+    # Nothing left to fold
+    assert compact(hourly_retention_hours=24, daily_retention_days=30, now=datetime(2026, 3, 3, 12)) == (0, 0)
+
+
+def test_compact_if_due(app, widget):
+    db.session.add(AnalyticsHourly(widget_id=widget.id, hour=datetime(2020, 1, 1), views=1))
+    db.session.commit()
+    app.extensions.pop('widgetic_last_compaction', None)
+    try:
+        app.config['ANALYTICS_COMPACT_INTERVAL'] = 0
+        assert compact_if_due(app) is None
+
+        app.config['ANALYTICS_COMPACT_INTERVAL'] = 3600
+        assert compact_if_due(app) == (1, 1)
+        db.session.add(AnalyticsHourly(widget_id=widget.id, hour=datetime(2020, 1, 1), views=1))
+        db.session.commit()
+        assert compact_if_due(app) is None  # Ran less than an hour ago
+        assert table(AnalyticsHourly, 'hour') == [(datetime(2020, 1, 1), 1)]
+    finally:
+        app.extensions.pop('widgetic_last_compaction', None)
+        app.config['ANALYTICS_COMPACT_INTERVAL'] = 3600
+
+
+def test_hourly_export_has_one_row_per_bucket(member_client, spread):
+    response = member_client.get(f'/website/{spread.website_id}/analytics/export?granularity=hour')
+
+    assert response.status_code == 200
+    exported = list(csv.reader(io.StringIO(response.get_data(as_text=True))))
+    assert exported[0] == ['bucket', 'widget_id', 'widget_name', 'views', 'clicks', 'dismissals']
+    assert [(row[0], row[3]) for row in exported[1:]] == [
+        ('2025-12-01T00:00:00', '30'),
+        ('2026-01-05T00:00:00', '7'),
+        ('2026-01-05T13:00:00', '1'),
+        ('2026-01-06T00:00:00', '4'),
+    ]
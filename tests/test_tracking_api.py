@@ -0,0 +1,137 @@
+import json
+import pytest
+from models import db, Widget
+
+MISSING = '00000000-0000-4000-8000-000000000000'
+
+
+def totals(widget_id):
+    db.session.expire_all()
+    widget = db.session.get(Widget, widget_id)
+    return widget.views, widget.clicks, widget.dismissals
+
+
+def test_track_counts_event(client, widget):
+    response = client.post(f'/api/widget/{widget.id}/track', json={'type': 'click'})
+
+    assert response.status_code == 200
+    assert response.json == {'success': True}
+    assert totals(widget.id) == (0, 1, 0)
+
+
+def test_track_accepts_text_plain(client, widget):
+    response = client.post(f'/api/widget/{widget.id}/track', data='{"type": "view"}', content_type='text/plain')
+
+    assert response.status_code == 200
+    assert totals(widget.id) == (1, 0, 0)
+
+
+def test_track_unknown_widget(client, app):
+    response = client.post(f'/api/widget/{MISSING}/track', json={'type': 'view'})
+
+    assert response.status_code == 404
+    assert response.json == {'error': 'Widget not found'}
+
+
+@pytest.mark.parametrize('body', ['[1]', '"view"', '3', 'null', 'not json', '',
+                                  '{"type": ["view"]}', '{"type": {"a": 1}}'])
+def test_track_ignores_bodies_that_are_not_objects(client, widget, body):
+    response = client.post(f'/api/widget/{widget.id}/track', data=body, content_type='text/plain')
+
+    assert response.status_code == 200
+    assert totals(widget.id) == (0, 0, 0)
+
+
+def test_track_ignores_unknown_event_types(client, widget):
+    assert client.post(f'/api/widget/{widget.id}/track', json={'type': 'hover'}).status_code == 200
+    assert client.post(f'/api/widget/{MISSING}/track', json={'type': 'hover'}).status_code == 404
+    assert totals(widget.id) == (0, 0, 0)
+
+
+def test_pixel(client, widget):
+    response = client.get(f'/api/widget/{widget.id}/pixel.gif?type=dismiss')
+    assert response.status_code == 200
+    assert response.mimetype == 'image/gif'
+    assert response.headers['Cache-Control'] == 'no-store'
+    assert totals(widget.id) == (0, 0, 1)
+
+    response = client.get(f'/api/widget/{MISSING}/pixel.gif?type=view')
+    assert response.status_code == 404
+    assert response.mimetype == 'image/gif'
+
+
+def test_batch(client, widget):
+    events = [{'widget_id': widget.id, 'type': 'view'}] * 3 + [
+        {'widget_id': widget.id, 'type': 'click'},
+        {'widget_id': MISSING, 'type': 'view'},
+        {'widget_id': widget.id, 'type': 'hover'},
+        {'widget_id': widget.id, 'type': {'a': 1}},
+        {'widget_id': widget.id, 'type': ['view']},
+        'not an event',
+    ]
+    response = client.post('/api/track/batch', data=json.dumps({'events': events}), content_type='text/plain')
+
+    assert response.status_code == 200
+    assert response.json == {'success': True, 'accepted': 4}
+    assert totals(widget.id) == (3, 1, 0)
+
+
+def test_batch_form_post(client, widget):
+    response = client.post('/api/track/batch', data={'events': json.dumps([{'widget_id': widget.id, 'type': 'view'}])})
+
+    assert response.status_code == 200
+    assert totals(widget.id) == (1, 0, 0)
+
+
+@pytest.mark.parametrize('body', ['{"events": 3}', '{"type": "view"}', '"view"', 'not json', ''])
+def test_batch_rejects_bodies_without_a_list(client, app, body):
+    response = client.post('/api/track/batch', data=body, content_type='text/plain')
+
+    assert response.status_code == 400
+    assert response.json == {'error': 'Expected a list of events'}
+
+
+def test_batch_rejects_oversized_batches(client, widget, app):
+    events = [{'widget_id': widget.id, 'type': 'view'}] * (app.config['TRACK_BATCH_MAX_EVENTS'] + 1)
+    response = client.post('/api/track/batch', json=events)
+
+    assert response.status_code == 413
+    assert totals(widget.id) == (0, 0, 0)
+
+
+def asgi_post(app, path, body):
+    """POST through the ASGI app (lazy startup, no lifespan) and return (status, body)."""
+    pytest.importorskip('aiosqlite')
+    pytest.importorskip('greenlet')  # SQLAlchemy's async engine
+    import asyncio
+    from asgi import PublicAPI
+
+    async def call():
+        api = PublicAPI(app)
+        sent = []
+        messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+
+        async def receive():
+            return messages.pop(0) if messages else {'type': 'http.disconnect'}
+
+        async def send(message):
+            sent.append(message)
+
+        scope = {'type': 'http', 'method': 'POST', 'path': path, 'query_string': b'', 'headers': []}
+        try:
+            await api(scope, receive, send)
+        finally:
+            await api.shutdown()
+        return sent[0]['status'], sent[1]['body']
+
+    return asyncio.run(call())
+
+
+def test_asgi_track_matches_flask(app, widget):
+    assert asgi_post(app, f'/api/widget/{MISSING}/track', b'{"type": "view"}') == (
+        404, b'{"error":"Widget not found"}\n')
+    assert asgi_post(app, f'/api/widget/{widget.id}/track', b'[1]') == (200, b'{"success":true}\n')
+    assert asgi_post(app, f'/api/widget/{widget.id}/track', b'{"type": ["view"]}') == (200, b'{"success":true}\n')
+    assert asgi_post(app, f'/api/widget/{widget.id}/track', b'{"type": {"a": 1}}') == (200, b'{"success":true}\n')
+    assert totals(widget.id) == (0, 0, 0)
+    assert asgi_post(app, '/api/track/batch', b'{"events": 3}')[0] == 400
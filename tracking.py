@@ -0,0 +1,324 @@
+from datetime import datetime, timedelta
+from collections import Counter
+import atexit
+import os
+import threading
+from sqlalchemy import func, bindparam
+from models import db, Widget, AnalyticsHourly
+from rollups import (upsert_counts, merge_visitor_sketches, counter_increments, counter_params, truncate_hour,
+                     compact_if_due)
+from hll import HyperLogLog
+
+# Maps the event type sent by widget.js to the counter column it bumps
+EVENT_FIELDS = {
+    'view': 'views',
+    'click': 'clicks',
+    'dismiss': 'dismissals'
+}
+
+# Client timestamps further off than this are ignored in favour of server time
+MAX_CLIENT_SKEW = timedelta(hours=24)
+
+# widget.js sends a random UUID; anything longer is not one of ours
+MAX_VISITOR_ID_LENGTH = 64
+
+
+def event_field(event_type):
+    """Return the counter column for an event type, or None if it is not one we count."""
+    if not isinstance(event_type, str):
+        # Lists and objects are unhashable; anything else is simply unknown
+        return None
+    return EVENT_FIELDS.get(event_type)
+
+
+def event_hour(ts, now=None):
+    """Return the UTC hour bucket an event belongs to.
+
+    `ts` is the client timestamp in epoch milliseconds. Batches are flushed
+    a few seconds after the event happened (or on pagehide), so we trust it
+    when it is plausible and fall back to server time otherwise.
+    """
+    now = now or datetime.utcnow()
+    if isinstance(ts, (int, float)) and not isinstance(ts, bool):
+        try:
+            when = datetime.utcfromtimestamp(ts / 1000.0)
+        except (ValueError, OverflowError, OSError):
+            return truncate_hour(now)
+        if now - MAX_CLIENT_SKEW <= when <= now + timedelta(minutes=5):
+            return truncate_hour(when)
+    return truncate_hour(now)
+
+
+def current_hour():
+    return truncate_hour(datetime.utcnow())
+
+
+def aggregate_events(events, now=None):
+    """Collapse raw events into {(widget_id, hour, field): count}.
+
+    Malformed entries and unknown event types are skipped.
+    """
+    counts = Counter()
+    for event in events:
+        if not isinstance(event, dict):
+            continue
+        field = event_field(event.get('type'))
+        widget_id = event.get('widget_id')
+        if not field or not isinstance(widget_id, str):
+            continue
+        counts[(widget_id, event_hour(event.get('ts'), now), field)] += 1
+    return counts
+
+
+def valid_visitor(visitor):
+    return isinstance(visitor, str) and 0 < len(visitor) <= MAX_VISITOR_ID_LENGTH
+
+
+def aggregate_visitors(events, visitor=None, now=None):
+    """Sketch the visitors behind view events as {(widget_id, hour): HyperLogLog}.
+
+    Each event's `visitor` id falls back to the batch-level `visitor`;
+    events without a usable id are left out of the sketches (their counts
+    still go through `aggregate_events`).
+    """
+    sketches = {}
+    for event in events:
+        if not isinstance(event, dict) or event_field(event.get('type')) != 'views':
+            continue
+        widget_id = event.get('widget_id')
+        event_visitor = event.get('visitor', visitor)
+        if not isinstance(widget_id, str) or not valid_visitor(event_visitor):
+            continue
+        key = (widget_id, event_hour(event.get('ts'), now))
+        sketches.setdefault(key, HyperLogLog()).add(event_visitor)
+    return sketches
+
+
+def event_sketches(widget_id, hour, field, visitor):
+    """Sketches for a single event, as `aggregate_visitors` would build them."""
+    if field != 'views' or not valid_visitor(visitor):
+        return {}
+    sketch = HyperLogLog()
+    sketch.add(visitor)
+    return {(widget_id, hour): sketch}
+
+
+def merge_sketch_maps(target, sketches):
+    """Union {(widget_id, hour): HyperLogLog} `sketches` into `target` in place."""
+    for key, sketch in sketches.items():
+        if key in target:
+            target[key].update(sketch)
+        else:
+            target[key] = HyperLogLog(sketch.registers)
+    return target
+
+
+def record_event(widget_id, field, hour, visitor=None):
+    """Apply a single event with one atomic UPDATE and one UPSERT.
+
+    Runs inside the caller's transaction. Views with a `visitor` id also
+    update the hour's visitor sketch. Returns False if the widget does not
+    exist, in which case nothing was written.
+    """
+    conn = db.session.connection()
+    widget_table = Widget.__table__
+    result = conn.execute(
+        widget_table.update()
+        .where(widget_table.c.id == widget_id)
+        .values({field: func.coalesce(widget_table.c[field], 0) + 1})
+    )
+    if result.rowcount == 0:
+        return False
+
+    row = {'widget_id': widget_id, 'hour': hour, 'views': 0, 'clicks': 0, 'dismissals': 0}
+    row[field] = 1
+    upsert_counts(conn, AnalyticsHourly.__table__, [row])
+    merge_visitor_sketches(conn, AnalyticsHourly.__table__, event_sketches(widget_id, hour, field, visitor))
+    return True
+
+
+def apply_counts(counts, conn=None, sketches=None):
+    """Apply aggregated counts to Widget totals and hourly analytics buckets.
+
+    Runs inside the caller's transaction on `conn` (default: the current
+    db.session connection); the caller commits. Each table is written with
+    a single executemany statement. `sketches` ({(widget_id, hour):
+    HyperLogLog}, see `aggregate_visitors`) are merged into the same hourly
+    rows. Counts for widgets that no longer exist are dropped. Returns the
+    number of events that were applied.
+    """
+    if not counts:
+        return 0
+
+    conn = conn or db.session.connection()
+    widget_ids = {widget_id for widget_id, _, _ in counts}
+    known_ids = set(conn.execute(
+        db.select(Widget.id).where(Widget.id.in_(widget_ids))
+    ).scalars())
+
+    totals = {}
+    hourly = {}
+    applied = 0
+    for (widget_id, hour, field), n in counts.items():
+        if widget_id not in known_ids:
+            continue
+        totals.setdefault(widget_id, Counter())[field] += n
+        hourly.setdefault((widget_id, hour), Counter())[field] += n
+        applied += n
+
+    if not applied:
+        return 0
+
+    # 1. Update Total Stats
+    widget_table = Widget.__table__
+    conn.execute(
+        widget_table.update()
+        .where(widget_table.c.id == bindparam('b_id'))
+        .values(**counter_increments(widget_table)),
+        [counter_params(widget_id, fields) for widget_id, fields in totals.items()]
+    )
+
+    # 2. Update Hourly Stats (compacted into daily Analytics later)
+    upsert_counts(conn, AnalyticsHourly.__table__, [
+        {
+            'widget_id': widget_id,
+            'hour': hour,
+            'views': fields['views'],
+            'clicks': fields['clicks'],
+            'dismissals': fields['dismissals']
+        }
+        for (widget_id, hour), fields in hourly.items()
+    ])
+
+    # 3. Merge visitor sketches into the rows just written
+    if sketches:
+        merge_visitor_sketches(conn, AnalyticsHourly.__table__, {
+            (widget_id, hour): sketch for (widget_id, hour), sketch in sketches.items()
+            if (widget_id, hour) in hourly
+        })
+
+    return applied
+
+
+class WriteBehindBuffer:
+    """In-process (widget_id, hour, field) -> count map flushed in the background.
+
+    The tracking endpoints only bump counters (and merge visitor sketches)
+    here; a daemon thread applies the accumulated deltas with `apply_counts`
+    every `interval` seconds, or sooner once `max_size` distinct keys are
+    buffered. Counts still pending at interpreter exit are drained by `stop`.
+
+    The thread is started by the first `add` in each process, so workers
+    forked from a preloaded app (gunicorn --preload) run their own.
+    """
+
+    def __init__(self, app, interval=5.0, max_size=10000):
+        self.app = app
+        self.interval = interval
+        self.max_size = max_size
+        self._counts = Counter()
+        self._sketches = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._start_lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+
+    def _is_running(self):
+        # False in a forked child until it starts its own thread
+        return self._pid == os.getpid()
+
+    def add(self, counts, sketches=None):
+        if not self._is_running():
+            with self._start_lock:
+                if not self._is_running():
+                    self.start()
+        with self._lock:
+            self._counts.update(counts)
+            if sketches:
+                merge_sketch_maps(self._sketches, sketches)
+            full = len(self._counts) >= self.max_size
+        if full:
+            self._wake.set()
+
+    def depth(self):
+        with self._lock:
+            return len(self._counts)
+
+    def flush(self):
+        """Apply everything buffered so far. Returns the number of events applied."""
+        with self._flush_lock:
+            with self._lock:
+                counts, self._counts = self._counts, Counter()
+                sketches, self._sketches = self._sketches, {}
+            if not counts:
+                return 0
+
+            with self.app.app_context():
+                try:
+                    applied = apply_counts(counts, sketches=sketches)
+                    db.session.commit()
+                except Exception:
+                    db.session.rollback()
+                    # Put the deltas back so the next flush retries them
+                    with self._lock:
+                        self._counts.update(counts)
+                        merge_sketch_maps(self._sketches, sketches)
+                    self.app.logger.exception("Write-behind flush failed")
+                    return 0
+                finally:
+                    db.session.remove()
+            return applied
+
+    def start(self):
+        if self._is_running():
+            return
+        if self._pid is not None:
+            # Forked from a running buffer: the parent flushes what it had
+            # buffered, and its locks and thread did not survive the fork
+            self._counts = Counter()
+            self._sketches = {}
+            self._lock = threading.Lock()
+            self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='widgetic-write-behind', daemon=True)
+        self._thread.start()
+        self._pid = os.getpid()
+        atexit.register(self.stop)
+
+    def stop(self):
+        if not self._is_running():
+            return  # Nothing was tracked in this process
+        self._stopped.set()
+        self._wake.set()
+        if self._thread is not threading.current_thread():
+            self._thread.join(timeout=self.interval + 5)
+        self.flush()
+        # A later add() starts it again
+        self._pid = None
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            if self._stopped.is_set():
+                break
+            self.flush()
+            compact_if_due(self.app)
+
+
+def init_write_behind(app):
+    """Create the write-behind buffer if TRACKING_WRITE_BEHIND is enabled.
+
+    Its flush thread starts when this process tracks its first event.
+    """
+    if not app.config.get('TRACKING_WRITE_BEHIND'):
+        return None
+    buffer = WriteBehindBuffer(
+        app,
+        interval=app.config['TRACKING_FLUSH_INTERVAL'],
+        max_size=app.config['TRACKING_BUFFER_MAX']
+    )
@@ -1,6 +1,7 @@
 
 import requests
-from app import app, db, Widget, Analytics
+from app import app, db, Widget
+from models import Analytics
 
 def verify_tracking():
     # 1. Get a widget